@@ -2,7 +2,38 @@
 #  CUSTOM LIBRARIES
 # ==============================================================================
 import copy
-from random import random
+import json
+import mmap
+import multiprocessing
+import os
+import Queue
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+from random import Random, random, seed, shuffle
+
+# numpy is optional and long to import (most of the startup time), it is
+# only imported by the solvers using it (see importNumpy)
+numpy = None
+
+
+def importNumpy():
+    '''
+    Import numpy on first use
+    :return: numpy module, None if it is not installed
+    '''
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            return None
+        numpy = module
+    return numpy
 
 
 class Genetic:
@@ -12,12 +43,13 @@ class Genetic:
     '''
 
     @staticmethod
-    def createPath(length, cities_list, once=True):
+    def createPath(length, cities_list, once=True, rand=random):
         '''
         Create a new path between cities from a list of cities picked randomly
         :param length: length f the path
         :param cities_list: list of cities
         :param once: If set to True, the cities from the list are only taken once
+        :param rand: random numbers generator in [0, 1) (ex: Random.random)
         :return: cities path
         '''
         if not (0 <= length):
@@ -27,7 +59,7 @@ class Genetic:
         c = list(cities_list)
         path = []
         for i in xrange(0, length):
-            randomIndex = random() * len(c)
+            randomIndex = rand() * len(c)
             if once:
                 path.extend([c.pop(int(randomIndex))])
             else:
@@ -63,11 +95,142 @@ class Genetic:
         return hybrid1, hybrid2
 
     @staticmethod
-    def mutation(path, percent=0.5):
+    def crossSegment(length, rand=random):
+        '''
+        :param length: number of cities of the parents
+        :param rand: random numbers generator in [0, 1)
+        :return: start and end index (included) of a random segment
+        '''
+        return sorted((int(rand() * length), int(rand() * length)))
+
+    @staticmethod
+    def crossPathOX(path1, path2, i=None, j=None, rand=random):
+        '''
+        Order crossover: child1 keeps the cities of path1 between i and j, the
+        other cities are taken in the order of path2 (and inversely for child2).
+        The children are always valid paths.
+        :param path1: first parent
+        :param path2: second parent
+        :param i: start index of the kept segment (random if None)
+        :param j: end index (included) of the kept segment (random if None)
+        :param rand: random numbers generator in [0, 1)
+        :return: child1, child2
+        '''
+        if len(path1) != len(path2):
+            raise AttributeError('parents lengths are not the same')
+        if i == None or j == None:
+            i, j = Genetic.crossSegment(len(path1), rand)
+
+        return Genetic.orderCrossChild(path1, path2, i, j), Genetic.orderCrossChild(path2, path1, i, j)
+
+    @staticmethod
+    def orderCrossChild(path1, path2, i, j):
+        '''
+        :return: child of the order crossover keeping path1[i:j + 1]
+        '''
+        l = len(path1)
+        child = list(path1)
+        kept = set(path1[i:j + 1])
+        pos = (j + 1) % l
+        for k in xrange(l):
+            city = path2[(j + 1 + k) % l]
+            if city not in kept:
+                child[pos] = city
+                pos = (pos + 1) % l
+        return child
+
+    @staticmethod
+    def crossPathPMX(path1, path2, i=None, j=None, rand=random):
+        '''
+        Partially mapped crossover: child1 keeps the cities of path1 between i
+        and j, the other positions come from path2 and the conflicts are
+        resolved with the mapping defined by the segment (and inversely for
+        child2). The children are always valid paths.
+        :param path1: first parent
+        :param path2: second parent
+        :param i: start index of the mapped segment (random if None)
+        :param j: end index (included) of the mapped segment (random if None)
+        :param rand: random numbers generator in [0, 1)
+        :return: child1, child2
+        '''
+        if len(path1) != len(path2):
+            raise AttributeError('parents lengths are not the same')
+        if i == None or j == None:
+            i, j = Genetic.crossSegment(len(path1), rand)
+
+        return Genetic.mappedCrossChild(path1, path2, i, j), Genetic.mappedCrossChild(path2, path1, i, j)
+
+    @staticmethod
+    def mappedCrossChild(path1, path2, i, j):
+        '''
+        :return: child of the partially mapped crossover keeping path1[i:j + 1]
+        '''
+        mapping = dict(zip(path1[i:j + 1], path2[i:j + 1]))
+        child = list(path2)
+        child[i:j + 1] = path1[i:j + 1]
+        for k in xrange(len(path2)):
+            if i <= k <= j:
+                continue
+            city = path2[k]
+            while city in mapping:
+                city = mapping[city]
+            child[k] = city
+        return child
+
+    @staticmethod
+    def crossPathERX(path1, path2, rand=random):
+        '''
+        Edge recombination crossover: the children are built mostly with the
+        edges of the parents, starting from the first city of each parent.
+        The children are always valid paths.
+        :param path1: first parent
+        :param path2: second parent
+        :param rand: random numbers generator in [0, 1)
+        :return: child1, child2
+        '''
+        if len(path1) != len(path2):
+            raise AttributeError('parents lengths are not the same')
+
+        return (Genetic.edgeCrossChild(path1, path2, path1[0], rand),
+                Genetic.edgeCrossChild(path1, path2, path2[0], rand))
+
+    @staticmethod
+    def edgeCrossChild(path1, path2, start, rand=random):
+        '''
+        :return: child of the edge recombination crossover starting from start
+        '''
+        l = len(path1)
+        edges = {}
+        for p in (path1, path2):
+            for k in xrange(l):
+                edges.setdefault(p[k], set()).update((p[k - 1], p[(k + 1) % l]))
+
+        child = []
+        remaining = set(path1)
+        city = start
+        while True:
+            child.append(city)
+            remaining.discard(city)
+            if not remaining:
+                break
+            for neighbour in edges[city]:
+                edges[neighbour].discard(city)
+            candidates = edges.pop(city)
+            if candidates:
+                # the neighbour with the fewest edges left, ties broken randomly
+                city = min(candidates, key=lambda c: (len(edges[c]), rand()))
+            else:
+                candidates = list(remaining)
+                city = candidates[int(rand() * len(candidates))]
+        return child
+
+    @staticmethod
+    def mutation(path, percent=0.5, rand=random):
         '''
         From a given path create a new path with some caracteristic swaped.
         :param path:
         :param percent: defines how swap mutation will occure (ratio between [0,1])
+        :param rand: random numbers generator in [0, 1)
         :return:
         '''
         if not (0 <= percent <= 1):
@@ -76,8 +239,8 @@ class Genetic:
         mutation_count = int(percent * len(path))
         hybrid = list(path)
         for i in xrange(0, mutation_count):
-            randomIndex1 = int(random() * len(hybrid))
-            randomIndex2 = int(random() * len(hybrid))
+            randomIndex1 = int(rand() * len(hybrid))
+            randomIndex2 = int(rand() * len(hybrid))
             tmp1 = hybrid[randomIndex1]
             tmp2 = hybrid[randomIndex2]
             hybrid[randomIndex1] = tmp2
@@ -107,6 +270,1327 @@ class Genetic:
         '''
         return sqrt((c1[1] - c2[1]) ** 2 + (c1[2] - c2[2]) ** 2)
 
+    @staticmethod
+    def createDistMatrix(cities_list):
+        '''
+        Compute once the distances between all the cities
+        :param cities_list: list of cities
+        :return: N x N matrix, matrix[i][j] is the distance between city i and city j
+        '''
+        matrix = []
+        for c1 in cities_list:
+            matrix.append([Genetic.dist(c1, c2) for c2 in cities_list])
+        return matrix
+
+    @staticmethod
+    def pathLength(path, dist_matrix):
+        '''
+        :param path: path of cities indices
+        :param dist_matrix: distance matrix of the cities
+        :return: length of the closed path
+        '''
+        if not path:
+            return 0.0
+        dist = 0.0
+        previous_town = path[-1]
+        for town in path:
+            dist += dist_matrix[previous_town][town]
+            previous_town = town
+        return dist
+
+    @staticmethod
+    def nearestNeighbourPath(grid, start):
+        '''
+        Build a path going each time to the nearest city not yet visited
+        :param grid: SpatialGrid of the cities
+        :param start: first city of the path
+        :return: path of cities indices
+        '''
+        grid = grid.copy()
+        grid.remove(start)
+        path = [start]
+        city = start
+        while grid.count > 0:
+            city = grid.nearest(grid.xs[city], grid.ys[city], 1)[0]
+            grid.remove(city)
+            path.append(city)
+        return path
+
+    @staticmethod
+    def greedyEdgePath(grid, neighbours):
+        '''
+        Greedy edge construction: the candidate edges (city, neighbour) are
+        added from the shortest to the longest when they don't give a city
+        more than 2 edges nor close a cycle. The fragments left are then
+        joined going each time to the nearest free end.
+        :param grid: SpatialGrid of the cities
+        :param neighbours: neighbours lists of the cities
+        :return: path of cities indices
+        '''
+        xs, ys = grid.xs, grid.ys
+        l = len(xs)
+        edges = set()
+        for i in xrange(l):
+            for j in neighbours[i]:
+                edges.add((sqrt((xs[i] - xs[j]) ** 2 + (ys[i] - ys[j]) ** 2), min(i, j), max(i, j)))
+
+        parent = range(l)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        links = [[] for i in xrange(l)]
+        for d, i, j in sorted(edges):
+            if len(links[i]) < 2 and len(links[j]) < 2:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[root_i] = root_j
+                    links[i].append(j)
+                    links[j].append(i)
+
+        # fragments, walked from one end to the other
+        fragments = []
+        fragment_of = {}
+        visited = [False] * l
+        for start in xrange(l):
+            if visited[start] or len(links[start]) == 2:
+                continue
+            fragment = []
+            previous, city = None, start
+            while city != None:
+                visited[city] = True
+                fragment.append(city)
+                following = [c for c in links[city] if c != previous]
+                previous, city = city, following[0] if following else None
+            fragment_of[fragment[0]] = fragment_of[fragment[-1]] = len(fragments)
+            fragments.append(fragment)
+
+        if not fragments:
+            return []
+        ends = SpatialGrid(xs, ys, fragment_of.keys())
+        path = fragments[0]
+        for city in set((path[0], path[-1])):
+            ends.remove(city)
+        while ends.count > 0:
+            end = ends.nearest(xs[path[-1]], ys[path[-1]], 1)[0]
+            fragment = fragments[fragment_of[end]]
+            if fragment[0] != end:
+                fragment.reverse()
+            for city in set((fragment[0], fragment[-1])):
+                ends.remove(city)
+            path.extend(fragment)
+        return path
+
+    @staticmethod
+    def spaceFillingCurvePath(xs, ys, order=16):
+        '''
+        Build a path visiting the cities in the order of a Hilbert curve
+        covering the bounding box of the cities
+        :param xs: x of the cities
+        :param ys: y of the cities
+        :param order: the curve goes through a 2^order x 2^order grid
+        :return: path of cities indices
+        '''
+        l = len(xs)
+        if l == 0:
+            return []
+        n = 1 << order
+        min_x, min_y = min(xs), min(ys)
+        size = max(max(xs) - min_x, max(ys) - min_y, 1e-9)
+        scale = (n - 1) / size
+
+        def hilbertIndex(x, y):
+            d = 0
+            s = n >> 1
+            while s > 0:
+                rx = 1 if x & s else 0
+                ry = 1 if y & s else 0
+                d += s * s * ((3 * rx) ^ ry)
+                if ry == 0:
+                    if rx == 1:
+                        x = n - 1 - x
+                        y = n - 1 - y
+                    x, y = y, x
+                s >>= 1
+            return d
+
+        keys = [hilbertIndex(int((xs[i] - min_x) * scale), int((ys[i] - min_y) * scale)) for i in xrange(l)]
+        return sorted(xrange(l), key=keys.__getitem__)
+
+    @staticmethod
+    def christofidesGraph(dist_matrix):
+        '''
+        Christofides-style multigraph: minimum spanning tree plus a greedy
+        (not minimum) matching of the cities with an odd degree. Every city
+        has an even degree so the graph has an eulerian circuit.
+        :param dist_matrix: distance matrix of the cities
+        :return: adjacency lists of the multigraph
+        '''
+        l = len(dist_matrix)
+        graph = [[] for i in xrange(l)]
+        if l < 2:
+            return graph
+
+        # Prim
+        best = list(dist_matrix[0])
+        parent = [0] * l
+        remaining = set(xrange(1, l))
+        while remaining:
+            u = min(remaining, key=best.__getitem__)
+            remaining.remove(u)
+            graph[u].append(parent[u])
+            graph[parent[u]].append(u)
+            row = dist_matrix[u]
+            for v in remaining:
+                if row[v] < best[v]:
+                    best[v] = row[v]
+                    parent[v] = u
+
+        odd = [i for i in xrange(l) if len(graph[i]) % 2 == 1]
+        pairs = sorted((dist_matrix[u][v], u, v) for k, u in enumerate(odd) for v in odd[k + 1:])
+        matched = set()
+        for d, u, v in pairs:
+            if u not in matched and v not in matched:
+                matched.update((u, v))
+                graph[u].append(v)
+                graph[v].append(u)
+        return graph
+
+    @staticmethod
+    def eulerShortcutPath(graph, start):
+        '''
+        Walk the eulerian circuit of graph from start and skip the cities
+        already visited
+        :param graph: adjacency lists of a connected graph with even degrees
+        :param start: first city of the path
+        :return: path of cities indices
+        '''
+        edges = [list(a) for a in graph]
+        stack = [start]
+        path = []
+        visited = [False] * len(graph)
+        while stack:
+            city = stack[-1]
+            if edges[city]:
+                following = edges[city].pop()
+                edges[following].remove(city)
+                stack.append(following)
+            else:
+                stack.pop()
+                if not visited[city]:
+                    visited[city] = True
+                    path.append(city)
+        return path
+
+    @staticmethod
+    def positions(path):
+        '''
+        :param path: path of cities indices
+        :return: position[city] is the index of the city in path
+        '''
+        position = [0] * len(path)
+        for i, city in enumerate(path):
+            position[city] = i
+        return position
+
+    @staticmethod
+    def activeQueue(path, active=None):
+        '''
+        :param path: path of cities indices
+        :param active: cities to check (all the cities if None)
+        :return: queue of the cities to check, queued[city] True if city is in the queue
+        '''
+        queued = [False] * len(path)
+        queue = deque()
+        for city in (path if active == None else active):
+            if not queued[city]:
+                queued[city] = True
+                queue.append(city)
+        return queue, queued
+
+    @staticmethod
+    def replacePath(path, cities):
+        '''
+        Replace in place the content of path (list or array) by cities
+        :return: n/a
+        '''
+        if isinstance(path, array):
+            path[:] = array(path.typecode, cities)
+        else:
+            path[:] = cities
+
+    @staticmethod
+    def reverseSegment(path, position, i, j):
+        '''
+        Reverse the cities of the path between the index i and j (both included,
+        the segment can wrap around the end of the path). The shortest of the
+        segment and its complement is reversed, which gives the same tour.
+        :param path: cities path (modified)
+        :param position: position[city] is the index of the city in path (modified)
+        :param i: index of the first city of the segment
+        :param j: index of the last city of the segment
+        :return: n/a
+        '''
+        l = len(path)
+        inner = (j - i) % l + 1
+        if 2 * inner > l:
+            i, j = (j + 1) % l, (i - 1) % l
+            inner = l - inner
+        for k in xrange(inner / 2):
+            c1 = path[i]
+            c2 = path[j]
+            path[i] = c2
+            position[c2] = i
+            path[j] = c1
+            position[c1] = j
+            i = (i + 1) % l
+            j = (j - 1) % l
+
+    @staticmethod
+    def exchangeBlocks(path, position, i, m, k):
+        '''
+        Exchange in place two consecutive blocks of the path: X (m cities from
+        the index i) and Y (k cities following X, indices wrap around the end
+        of the path). With R the rest of the path, the cycle X Y R becomes
+        Y X R, which is also X R Y and R Y X: the two smallest blocks are
+        exchanged, only the cities of these blocks are moved.
+        :param path: cities path (modified)
+        :param position: position[city] is the index of the city in path (modified)
+        :param i: index of the first city of X
+        :param m: number of cities of X
+        :param k: number of cities of Y
+        :return: n/a
+        '''
+        l = len(path)
+        r = l - m - k
+        # the largest block stays in place
+        if m > r and m >= k:
+            i, m, k = (i + m) % l, k, r
+        elif k > r and k > m:
+            i, m, k = (i + m + k) % l, r, m
+        # the smallest block is kept aside, the other one is shifted
+        if m <= k:
+            kept = [path[(i + t) % l] for t in xrange(m)]
+            for t in xrange(k):
+                city = path[(i + m + t) % l]
+                path[(i + t) % l] = city
+                position[city] = (i + t) % l
+            start = i + k
+        else:
+            kept = [path[(i + m + t) % l] for t in xrange(k)]
+            for t in xrange(m - 1, -1, -1):
+                city = path[(i + t) % l]
+                path[(i + k + t) % l] = city
+                position[city] = (i + k + t) % l
+            start = i
+        for t, city in enumerate(kept):
+            path[(start + t) % l] = city
+            position[city] = (start + t) % l
+
+    @staticmethod
+    def twoOpt(path, rank, dist_matrix, neighbours, deadline=None, active=None):
+        '''
+        2-opt local search: replace the edges (a, b) and (c, d) by (a, c) and
+        (b, d) while it shortens the path. Only the nearest neighbours of a are
+        tried for c, and a city is checked again only when one of its edges
+        changed (don't look bits).
+        :param path: cities path (modified)
+        :param rank: length of the path
+        :param dist_matrix: distance matrix of the cities
+        :param neighbours: neighbours lists of the cities
+        :param deadline: time.time() after which the search stops
+        :param active: cities checked first (all the cities if None)
+        :return: new length of the path, number of moves done
+        '''
+        l = len(path)
+        moves = 0
+        if l < 4:
+            return rank, moves
+        d = dist_matrix
+        position = Genetic.positions(path)
+        queue, queued = Genetic.activeQueue(path, active)
+        checks = 0
+
+        while queue:
+            checks += 1
+            if deadline != None and checks & 255 == 0 and time.time() > deadline:
+                break
+            a = queue.popleft()
+            queued[a] = False
+            improved = False
+            for succ in (True, False):
+                pos_a = position[a]
+                b = path[(pos_a + 1) % l] if succ else path[pos_a - 1]
+                d_ab = d[a][b]
+                for c in neighbours[a]:
+                    d_ac = d[a][c]
+                    if d_ac >= d_ab:
+                        break
+                    pos_c = position[c]
+                    e = path[(pos_c + 1) % l] if succ else path[pos_c - 1]
+                    if c == b or e == a:
+                        continue
+                    delta = d_ac + d[b][e] - d_ab - d[c][e]
+                    if delta < -1e-9:
+                        if succ:
+                            Genetic.reverseSegment(path, position, position[b], pos_c)
+                        else:
+                            Genetic.reverseSegment(path, position, pos_a, position[e])
+                        rank += delta
+                        moves += 1
+                        for city in (a, b, c, e):
+                            if not queued[city]:
+                                queued[city] = True
+                                queue.append(city)
+                        improved = True
+                        break
+                if improved:
+                    break
+
+        return rank, moves
+
+    @staticmethod
+    def orOpt(path, rank, dist_matrix, neighbours, deadline=None, active=None, max_segment=3):
+        '''
+        Or-opt local search: move a segment of 1 to max_segment cities, maybe
+        reversed, between two consecutive cities near one of its ends while it
+        shortens the path (neighbours lists and don't look bits like twoOpt).
+        :param path: cities path (modified)
+        :param rank: length of the path
+        :param dist_matrix: distance matrix of the cities
+        :param neighbours: neighbours lists of the cities
+        :param deadline: time.time() after which the search stops
+        :param active: cities checked first (all the cities if None)
+        :param max_segment: length of the longest segment moved
+        :return: new length of the path, number of moves done
+        '''
+        l = len(path)
+        moves = 0
+        if l < max_segment + 3:
+            return rank, moves
+        d = dist_matrix
+        position = Genetic.positions(path)
+        queue, queued = Genetic.activeQueue(path, active)
+        checks = 0
+
+        while queue:
+            checks += 1
+            if deadline != None and checks & 255 == 0 and time.time() > deadline:
+                break
+            s1 = queue.popleft()
+            queued[s1] = False
+            for length in xrange(1, max_segment + 1):
+                i = position[s1]
+                s2 = path[(i + length - 1) % l]
+                p = path[i - 1]
+                n = path[(i + length) % l]
+                gain = d[p][s1] + d[s2][n] - d[p][n]
+                if gain <= 1e-9:
+                    continue
+                best = None
+                for c in neighbours[s1] + neighbours[s2]:
+                    if (position[c] - i) % l < length:
+                        continue
+                    pos_c = position[c]
+                    for u, v in ((c, path[(pos_c + 1) % l]), (path[pos_c - 1], c)):
+                        if (position[u] - i) % l < length or (position[v] - i) % l < length:
+                            continue
+                        for a, b in ((s1, s2), (s2, s1)):
+                            delta = d[u][a] + d[b][v] - d[u][v] - gain
+                            if delta < -1e-9 and (best == None or delta < best[0]):
+                                best = (delta, u, v, a == s2)
+                if best == None:
+                    continue
+
+                # the segment (maybe reversed) and the cities n..u are exchanged
+                delta, u, v, reverse = best
+                if reverse:
+                    Genetic.reverseSegment(path, position, i, (i + length - 1) % l)
+                Genetic.exchangeBlocks(path, position, i, length, (position[u] - i - length) % l + 1)
+                rank += delta
+                moves += 1
+                for city in (p, n, s1, s2, u, v):
+                    if not queued[city]:
+                        queued[city] = True
+                        queue.append(city)
+                break
+
+        return rank, moves
+
+    @staticmethod
+    def threeOpt(path, rank, dist_matrix, neighbours, deadline=None, active=None):
+        '''
+        3-opt local search with the segment insertion move (or3opt): the
+        edges (a, b), (c, d) and (e, f) are replaced by (a, d), (e, b) and
+        (c, f), which moves the segment b..c between e and f without
+        reversing it. d is searched in the neighbours of a and f in the
+        neighbours of c, with don't look bits like twoOpt.
+        :param path: cities path (modified)
+        :param rank: length of the path
+        :param dist_matrix: distance matrix of the cities
+        :param neighbours: neighbours lists of the cities
+        :param deadline: time.time() after which the search stops
+        :param active: cities checked first (all the cities if None)
+        :return: new length of the path, number of moves done
+        '''
+        l = len(path)
+        moves = 0
+        if l < 5:
+            return rank, moves
+        dm = dist_matrix
+        position = Genetic.positions(path)
+        queue, queued = Genetic.activeQueue(path, active)
+        checks = 0
+
+        while queue:
+            checks += 1
+            if deadline != None and checks & 255 == 0 and time.time() > deadline:
+                break
+            a = queue.popleft()
+            queued[a] = False
+            pos_b = (position[a] + 1) % l
+            b = path[pos_b]
+            d_ab = dm[a][b]
+            move = None
+            for d in neighbours[a]:
+                g1 = d_ab - dm[a][d]
+                if g1 <= 0:
+                    break
+                if d == b:
+                    continue
+                c = path[position[d] - 1]
+                offset_d = (position[d] - pos_b) % l
+                for f in neighbours[c]:
+                    g2 = g1 + dm[c][d] - dm[c][f]
+                    if g2 <= 0:
+                        break
+                    offset_f = (position[f] - pos_b) % l
+                    if offset_f <= offset_d:
+                        continue
+                    e = path[position[f] - 1]
+                    delta = dm[e][b] - dm[e][f] - g2
+                    if delta < -1e-9:
+                        move = (delta, c, d, e, f, offset_d, offset_f)
+                        break
+                if move != None:
+                    break
+            if move == None:
+                continue
+
+            # the segments b..c and d..e are exchanged
+            delta, c, d, e, f, offset_d, offset_f = move
+            Genetic.exchangeBlocks(path, position, pos_b, offset_d, offset_f - offset_d)
+            rank += delta
+            moves += 1
+            for city in (a, b, c, d, e, f):
+                if not queued[city]:
+                    queued[city] = True
+                    queue.append(city)
+
+        return rank, moves
+
+    @staticmethod
+    def doubleBridge(path, dist_matrix, segment=50, rand=random):
+        '''
+        Random double bridge kick A B C D -> A C B D, with B and C segments of
+        at most segment cities so that the kick stays local
+        :param path: cities path (modified)
+        :param dist_matrix: distance matrix of the cities
+        :param segment: longest length of B and C
+        :param rand: random numbers generator in [0, 1)
+        :return: length difference, cities whose edges changed
+        '''
+        l = len(path)
+        if l < 8:
+            return 0.0, []
+        d = dist_matrix
+        length = max(1, min(segment, l / 4))
+        start = int(rand() * l)
+        rotated = list(path[start:]) + list(path[:start])
+        p1 = 1 + int(rand() * length)
+        p2 = p1 + 1 + int(rand() * length)
+        p3 = p2 + 1 + int(rand() * length)
+        A, B, C, D = rotated[:p1], rotated[p1:p2], rotated[p2:p3], rotated[p3:]
+        delta = (d[A[-1]][C[0]] + d[C[-1]][B[0]] + d[B[-1]][D[0]]
+                 - d[A[-1]][B[0]] - d[B[-1]][C[0]] - d[C[-1]][D[0]])
+        Genetic.replacePath(path, A + C + B + D)
+        return delta, [A[-1], B[0], B[-1], C[0], C[-1], D[0]]
+
+    @staticmethod
+    def chainedLocalSearch(path, rank, dist_matrix, neighbours, deadline=None, active=None, kicks=20,
+                           rand=random):
+        '''
+        Chained local search (in the spirit of chained Lin-Kernighan): the path
+        is improved with twoOpt and orOpt, then kicked with a double bridge and
+        improved again around the kick; the kicked path is kept only if it is
+        shorter.
+        :param path: cities path (modified)
+        :param rank: length of the path
+        :param dist_matrix: distance matrix of the cities
+        :param neighbours: neighbours lists of the cities
+        :param deadline: time.time() after which the search stops
+        :param active: cities checked first by the first descent
+        :param kicks: number of double bridge kicks tried
+        :param rand: random numbers generator in [0, 1)
+        :return: new length of the path, number of moves done
+        '''
+        rank, moves = Genetic.twoOpt(path, rank, dist_matrix, neighbours, deadline, active)
+        rank, m = Genetic.orOpt(path, rank, dist_matrix, neighbours, deadline, active)
+        moves += m
+        for k in xrange(kicks):
+            if deadline != None and time.time() > deadline:
+                break
+            candidate = path[:]
+            delta, ends = Genetic.doubleBridge(candidate, dist_matrix, rand=rand)
+            if not ends:
+                break
+            r, m1 = Genetic.twoOpt(candidate, rank + delta, dist_matrix, neighbours, deadline, ends)
+            r, m2 = Genetic.orOpt(candidate, r, dist_matrix, neighbours, deadline, ends)
+            moves += m1 + m2
+            if r < rank - 1e-9:
+                path[:] = candidate
+                rank = r
+        return rank, moves
+
+# ==============================================================================
+#  SPATIAL INDEX
+# ==============================================================================
+
+class SpatialGrid(object):
+    '''
+    Uniform grid over the cities, used to find the nearest cities without
+    computing the distances to all the other cities
+    '''
+
+    def __init__(self, xs, ys, indices=None, per_cell=2):
+        '''
+        :param xs: x of the cities
+        :param ys: y of the cities
+        :param indices: cities put in the grid (all the cities if None)
+        :param per_cell: mean number of cities in a cell
+        '''
+        self.xs = xs
+        self.ys = ys
+        if indices == None:
+            indices = xrange(len(xs))
+        indices = list(indices)
+        self.count = len(indices)
+
+        if indices:
+            self.min_x = min(xs[i] for i in indices)
+            self.min_y = min(ys[i] for i in indices)
+            width = max(xs[i] for i in indices) - self.min_x
+            height = max(ys[i] for i in indices) - self.min_y
+        else:
+            self.min_x = self.min_y = width = height = 0
+        cells_count = max(1, self.count / per_cell)
+        if width * height > 0:
+            self.cell_size = sqrt(width * height / cells_count)
+        else:
+            self.cell_size = max(width, height, 1.0) / cells_count
+        self.cols = int(width / self.cell_size) + 1
+        self.rows = int(height / self.cell_size) + 1
+        self.cells = [[] for i in xrange(self.cols * self.rows)]
+        for i in indices:
+            cx, cy = self.cellOf(xs[i], ys[i])
+            self.cells[cy * self.cols + cx].append(i)
+
+    def cellOf(self, x, y):
+        '''
+        :return: column and row of the cell containing (x, y), clamped in the grid
+        '''
+        cx = min(max(int((x - self.min_x) / self.cell_size), 0), self.cols - 1)
+        cy = min(max(int((y - self.min_y) / self.cell_size), 0), self.rows - 1)
+        return cx, cy
+
+    def copy(self):
+        '''
+        :return: copy of the grid, cities can be removed from it independently
+        '''
+        grid = copy.copy(self)
+        grid.cells = [list(cell) for cell in self.cells]
+        return grid
+
+    def remove(self, i):
+        '''
+        Remove the city i from the grid
+        :return: n/a
+        '''
+        cx, cy = self.cellOf(self.xs[i], self.ys[i])
+        self.cells[cy * self.cols + cx].remove(i)
+        self.count -= 1
+
+    def nearest(self, x, y, k, exclude=None):
+        '''
+        Search the cells ring after ring around (x, y) until the k nearest
+        cities are sure to be found
+        :param x: x of the searched position
+        :param y: y of the searched position
+        :param k: number of cities wanted
+        :param exclude: city ignored by the search (ex: the city at (x, y))
+        :return: the k nearest cities, from the nearest
+        '''
+        xs, ys, cells, cols = self.xs, self.ys, self.cells, self.cols
+        cx, cy = self.cellOf(x, y)
+        found = []
+        for r in xrange(max(self.cols, self.rows)):
+            for ry in xrange(max(cy - r, 0), min(cy + r, self.rows - 1) + 1):
+                if abs(ry - cy) == r:
+                    columns = xrange(max(cx - r, 0), min(cx + r, cols - 1) + 1)
+                else:
+                    columns = [c for c in (cx - r, cx + r) if 0 <= c < cols]
+                for rx in columns:
+                    for i in cells[ry * cols + rx]:
+                        if i != exclude:
+                            found.append(((xs[i] - x) ** 2 + (ys[i] - y) ** 2, i))
+            # every city closer than r cells from (x, y) has been seen
+            if len(found) >= k:
+                found.sort()
+                found = found[:k]
+                if found[-1][0] <= (r * self.cell_size) ** 2:
+                    break
+        found.sort()
+        return [i for d, i in found[:k]]
+
+    def neighboursLists(self, count):
+        '''
+        The cities of a cell share the candidates of the block of cells around
+        it, nearest is only used when the block is too small to be sure
+        :param count: number of neighbours kept for each city
+        :return: for each city, the list of its nearest cities sorted by distance
+        '''
+        xs, ys, cells, cols, rows = self.xs, self.ys, self.cells, self.cols, self.rows
+        size = self.cell_size
+        # block radius (in cells) giving about 3 * count candidates
+        r = 1
+        while (2 * r + 1) ** 2 * self.count < 3 * count * len(cells):
+            r += 1
+        lists = [None] * len(xs)
+        for cy in xrange(rows):
+            for cx in xrange(cols):
+                cell = cells[cy * cols + cx]
+                if not cell:
+                    continue
+                block = []
+                for ry in xrange(max(cy - r, 0), min(cy + r, rows - 1) + 1):
+                    for rx in xrange(max(cx - r, 0), min(cx + r, cols - 1) + 1):
+                        block.extend(cells[ry * cols + rx])
+                left = self.min_x + cx * size
+                top = self.min_y + cy * size
+                for i in cell:
+                    x, y = xs[i], ys[i]
+                    found = sorted(((xs[j] - x) ** 2 + (ys[j] - y) ** 2, j) for j in block if j != i)[:count]
+                    # every city closer than radius is in the block
+                    radius = r * size + min(x - left, left + size - x, y - top, top + size - y)
+                    if len(found) == count and found[-1][0] <= radius * radius:
+                        lists[i] = [j for d, j in found]
+                    else:
+                        lists[i] = self.nearest(x, y, count, i)
+        return lists
+
+
+class CoordinatesMatrix(object):
+    '''
+    Distance matrix of the instances too large for Genetic.createDistMatrix:
+    matrix[i][j] is computed from the coordinates arrays when it is read,
+    so the memory stays O(n)
+    '''
+    __slots__ = ('xs', 'ys')
+
+    def __init__(self, xs, ys):
+        self.xs = xs
+        self.ys = ys
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __getitem__(self, i):
+        return CoordinatesRow(self.xs, self.ys, i)
+
+
+class CoordinatesRow(object):
+    '''
+    Distances from the city i to the other cities (see CoordinatesMatrix)
+    '''
+    __slots__ = ('xs', 'ys', 'x', 'y')
+
+    def __init__(self, xs, ys, i):
+        self.xs = xs
+        self.ys = ys
+        self.x = xs[i]
+        self.y = ys[i]
+
+    def __getitem__(self, j):
+        return sqrt((self.xs[j] - self.x) ** 2 + (self.ys[j] - self.y) ** 2)
+
+
+# ==============================================================================
+#  METRICS
+# ==============================================================================
+
+class Metrics(object):
+    '''
+    Collect the time spent in each stage of Darwin.runAlgorithm, the counters
+    (fitness evaluations, 2opt moves) and the best/mean rank of every
+    generation. Give an instance to Darwin with metrics=..., without it the
+    solver does not measure anything.
+    '''
+
+    def __init__(self, callback=None):
+        '''
+        :param callback: function called with the record of every generation
+        '''
+        self.callback = callback
+        self.stages = []
+        self.totals = {}
+        self.counters = {}
+        self.generations = []
+        self.current = {}
+
+    def start(self):
+        '''
+        :return: current time, to give to the first stage of a generation
+        '''
+        return time.time()
+
+    def stage(self, name, startTime):
+        '''
+        Add the time since startTime to the stage name
+        :return: current time, start of the next stage
+        '''
+        now = time.time()
+        if name not in self.totals:
+            self.stages.append(name)
+            self.totals[name] = 0.0
+        self.current[name] = self.current.get(name, 0.0) + now - startTime
+        return now
+
+    def merge(self, other):
+        '''
+        Add the stages and the counters of the current generation of other
+        (ex: recorded by a thread, the stages then add the time of every
+        thread) to the current generation
+        :param other: Metrics
+        :return: n/a
+        '''
+        for name in other.stages:
+            if name not in self.totals:
+                self.stages.append(name)
+                self.totals[name] = 0.0
+        for key, value in other.current.items():
+            self.current[key] = self.current.get(key, 0) + value
+
+    def count(self, name, n=1):
+        '''
+        Add n to the counter name of the current generation
+        '''
+        key = '#' + name
+        self.current[key] = self.current.get(key, 0) + n
+
+    def endGeneration(self, ranks):
+        '''
+        Record the current generation
+        :param ranks: ranks of the population kept for the next generation
+        :return: n/a
+        '''
+        record = {'generation': len(self.generations), 'time': time.time()}
+        if len(ranks):
+            record['best'] = float(min(ranks))
+            record['mean'] = float(sum(ranks)) / len(ranks)
+        for key, value in self.current.items():
+            if key.startswith('#'):
+                self.counters[key[1:]] = self.counters.get(key[1:], 0) + value
+                record[key[1:]] = value
+            else:
+                self.totals[key] += value
+                record[key] = value
+        self.current = {}
+        self.generations.append(record)
+        if self.callback:
+            self.callback(record)
+
+    def summary(self):
+        '''
+        :return: dict with the time spent in every stage and the counters of the whole run
+        '''
+        return {'generations': len(self.generations), 'stages': dict(self.totals),
+                'counters': dict(self.counters)}
+
+    def dumpJSON(self, f):
+        '''
+        Write the summary and the records of the generations as JSON
+        :param f: opened file
+        '''
+        json.dump({'summary': self.summary(), 'generations': self.generations}, f)
+
+    def dumpCSV(self, f):
+        '''
+        Write the records of the generations as CSV, one line per generation
+        :param f: opened file
+        '''
+        columns = ['generation', 'time', 'best', 'mean'] + self.stages + sorted(self.counters)
+        f.write(';'.join(columns) + '\n')
+        for record in self.generations:
+            f.write(';'.join(str(record.get(c, '')) for c in columns) + '\n')
+
+    def dump(self, fileName):
+        '''
+        Write the metrics in fileName, as CSV if it ends with .csv else as JSON
+        '''
+        with open(fileName, 'w') as f:
+            if fileName.lower().endswith('.csv'):
+                self.dumpCSV(f)
+            else:
+                self.dumpJSON(f)
+
+
+# ==============================================================================
+#  SCHEDULER
+# ==============================================================================
+
+class Scheduler(object):
+    '''
+    Follow the time budget of Darwin.run: estimate the cost of a generation
+    and of its stages (moving averages), give the deadlines checked inside
+    runAlgorithm and tell how much of a generation still fits in the
+    remaining time.
+    '''
+
+    def __init__(self, max_time_s, start_time=None, margin=0.05):
+        '''
+        :param max_time_s: time budget (no deadline if <= 0)
+        :param start_time: time.time() when the budget started
+        :param margin: time kept to return the result after the deadline
+        '''
+        self.max_time_s = max_time_s
+        self.start_time = start_time if start_time != None else time.time()
+        self.deadline = None
+        if max_time_s > 0:
+            self.deadline = self.start_time + max_time_s - min(margin, max_time_s / 10.0)
+        self.estimates = {}
+        self.generation_start = None
+
+    def remaining(self):
+        '''
+        :return: seconds left before the deadline (infinite without deadline)
+        '''
+        if self.deadline == None:
+            return float('inf')
+        return self.deadline - time.time()
+
+    def expired(self):
+        return self.deadline != None and time.time() > self.deadline
+
+    def record(self, name, duration):
+        '''
+        Update the moving average of the cost of name
+        '''
+        previous = self.estimates.get(name)
+        self.estimates[name] = duration if previous == None else 0.7 * previous + 0.3 * duration
+
+    def estimate(self, name):
+        '''
+        :return: estimated cost of name, 0 if never recorded
+        '''
+        return self.estimates.get(name, 0.0)
+
+    def startGeneration(self):
+        self.generation_start = time.time()
+
+    def endGeneration(self):
+        self.record('generation', time.time() - self.generation_start)
+
+    def scale(self):
+        '''
+        :return: part of a whole generation that fits in the remaining time,
+            between 0 and 1
+        '''
+        generation = self.estimate('generation')
+        if self.deadline == None or generation <= 0:
+            return 1.0
+        return max(0.0, min(1.0, self.remaining() / generation))
+
+    def stageDeadline(self, budget=None, reserve=0.0):
+        '''
+        :param budget: time allowed to the stage (None: no limit)
+        :param reserve: time needed by the stages following this one
+        :return: time.time() when the stage must stop, None if it has no limit
+        '''
+        deadline = time.time() + budget if budget != None else None
+        if self.deadline != None:
+            end = self.deadline - reserve
+            deadline = end if deadline == None else min(deadline, end)
+        return deadline
+
+
+# ==============================================================================
+#  SELECTION
+# ==============================================================================
+
+class Selection(object):
+    '''
+    Choose the parents in a population sorted from the best path:
+    - rank: roulette where the weight of the i-th path of count is count - i,
+      by bisection in the cumulative weights
+    - tournament: the best of tournament_size random paths, on a sorted
+      population the smallest of tournament_size random indices
+    - sus: stochastic universal sampling of the rank weights, n equally
+      spaced pointers from a single random number
+    The cumulative weights are computed once per population size.
+    '''
+
+    METHODS = ('rank', 'tournament', 'sus')
+
+    def __init__(self, method='rank', tournament_size=2):
+        if method not in Selection.METHODS:
+            raise AttributeError('unknown selection %s' % method)
+        if tournament_size < 1:
+            raise AttributeError('tournament_size is not in range')
+        self.method = method
+        self.tournament_size = tournament_size
+        self.tables = {}
+        self.numpy_tables = {}
+
+    def table(self, count):
+        '''
+        :param count: size of the sorted population
+        :return: cumulative probabilities of the rank weights count - i
+        '''
+        table = self.tables.get(count)
+        if table == None:
+            total = count * (count + 1) / 2.0
+            table = []
+            cumulative = 0
+            for i in xrange(count):
+                cumulative += count - i
+                table.append(cumulative / total)
+            self.tables[count] = table
+        return table
+
+    def select(self, count, n, rand=random):
+        '''
+        :param count: size of the sorted population
+        :param n: number of parents wanted
+        :param rand: random numbers generator in [0, 1)
+        :return: list of n indices in the population
+        '''
+        if count <= 0:
+            return []
+        if self.method == 'tournament':
+            size = self.tournament_size
+            return [min(int(rand() * count) for k in xrange(size)) for i in xrange(n)]
+        table = self.table(count)
+        last = count - 1
+        if self.method == 'rank':
+            return [min(bisect_right(table, rand()), last) for i in xrange(n)]
+        # sus: the pointers are increasing, the table is walked once
+        picks = []
+        step = 1.0 / n
+        pointer = rand() * step
+        i = 0
+        for k in xrange(n):
+            while i < last and table[i] <= pointer:
+                i += 1
+            picks.append(i)
+            pointer += step
+        # the crossover pairs neighbours, they must not be sorted
+        shuffle(picks, rand)
+        return picks
+
+    def selectBatch(self, count, n, np_rng):
+        '''
+        Batched version of select for the numpy engine
+        :param np_rng: numpy RandomState
+        :return: array of n indices in the population
+        '''
+        if self.method == 'tournament':
+            return np_rng.randint(0, count, (n, self.tournament_size)).min(axis=1)
+        table = self.numpy_tables.get(count)
+        if table is None:
+            table = self.numpy_tables[count] = numpy.array(self.table(count))
+        if self.method == 'rank':
+            pointers = np_rng.random_sample(n)
+        else:
+            pointers = (np_rng.random_sample() + numpy.arange(n)) / n
+        picks = numpy.minimum(numpy.searchsorted(table, pointers, side='right'), count - 1)
+        if self.method == 'sus':
+            np_rng.shuffle(picks)
+        return picks
+
+
+# ==============================================================================
+#  KERNELS
+# ==============================================================================
+
+def pathLengthKernel(path, dist_matrix):
+    '''
+    Compiled Genetic.pathLength
+    '''
+    l = path.shape[0]
+    dist = 0.0
+    if l == 0:
+        return dist
+    previous_town = path[l - 1]
+    for k in range(l):
+        town = path[k]
+        dist += dist_matrix[previous_town, town]
+        previous_town = town
+    return dist
+
+
+def mutationKernel(path, randoms):
+    '''
+    Compiled Genetic.mutation, the random numbers are given
+    :param randoms: 2 random numbers in [0, 1) per swap
+    '''
+    hybrid = path.copy()
+    l = hybrid.shape[0]
+    for k in range(randoms.shape[0] // 2):
+        randomIndex1 = int(randoms[2 * k] * l)
+        randomIndex2 = int(randoms[2 * k + 1] * l)
+        tmp1 = hybrid[randomIndex1]
+        hybrid[randomIndex1] = hybrid[randomIndex2]
+        hybrid[randomIndex2] = tmp1
+    return hybrid
+
+
+def twoOptKernel(path, position, rank, dist_matrix, neighbours, queue, queued, head, count, max_checks):
+    '''
+    Compiled Genetic.twoOpt (same moves in the same order), stopped after
+    max_checks cities so the caller can check the deadline. The queue is a
+    ring buffer of len(path) cities starting at head.
+    :return: new length of the path, number of moves done, head and count of the queue
+    '''
+    l = path.shape[0]
+    d = dist_matrix
+    moves = 0
+    checks = 0
+    while count > 0 and checks < max_checks:
+        checks += 1
+        a = queue[head]
+        head = (head + 1) % l
+        count -= 1
+        queued[a] = False
+        improved = False
+        for side in range(2):
+            pos_a = position[a]
+            if side == 0:
+                b = path[(pos_a + 1) % l]
+            else:
+                b = path[(pos_a - 1) % l]
+            d_ab = d[a, b]
+            for m in range(neighbours.shape[1]):
+                c = neighbours[a, m]
+                if c < 0:
+                    break
+                d_ac = d[a, c]
+                if d_ac >= d_ab:
+                    break
+                pos_c = position[c]
+                if side == 0:
+                    e = path[(pos_c + 1) % l]
+                else:
+                    e = path[(pos_c - 1) % l]
+                if c == b or e == a:
+                    continue
+                delta = d_ac + d[b, e] - d_ab - d[c, e]
+                if delta < -1e-9:
+                    # Genetic.reverseSegment
+                    if side == 0:
+                        i, j = position[b], pos_c
+                    else:
+                        i, j = pos_a, position[e]
+                    inner = (j - i) % l + 1
+                    if 2 * inner > l:
+                        i, j = (j + 1) % l, (i - 1) % l
+                        inner = l - inner
+                    for k in range(inner // 2):
+                        c1 = path[i]
+                        c2 = path[j]
+                        path[i] = c2
+                        position[c2] = i
+                        path[j] = c1
+                        position[c1] = j
+                        i = (i + 1) % l
+                        j = (j - 1) % l
+                    rank += delta
+                    moves += 1
+                    for city in (a, b, c, e):
+                        if not queued[city]:
+                            queued[city] = True
+                            queue[(head + count) % l] = city
+                            count += 1
+                    improved = True
+                    break
+            if improved:
+                break
+    return rank, moves, head, count
+
+
+class Kernels(object):
+    '''
+    Compiled versions of the hot loops of DarwinForCities: ranking
+    (Genetic.pathLength), 2-opt (Genetic.twoOpt) and swap mutation
+    (Genetic.mutation), giving the same results as the pure Python
+    functions. They need numba, which compiles them once (cached on disk);
+    without it the solver keeps the Genetic functions.
+
+    The compilation takes seconds: kernels='auto' only uses the kernels
+    once they are in the numba cache, kernels='numba' compiles them when
+    needed (see warmUp).
+    '''
+
+    # below this number of cities the compiled kernels are not worth it
+    MIN_CITIES = 100
+    # below this time budget (seconds) importing numba, about half a second,
+    # costs more than the kernels save
+    MIN_TIME = 2.0
+    # cities checked by twoOptKernel between two checks of the deadline
+    CHECKS = 1 << 12
+    DTYPES = {'H': 'uint16', 'I': 'uint32'}
+
+    compiled = None
+
+    @staticmethod
+    def load():
+        '''
+        Import numba and compile the kernels on first use
+        :return: dict name -> compiled kernel, None if numba is not installed
+        '''
+        if Kernels.compiled is None:
+            Kernels.compiled = {}
+            try:
+                import numba
+            except ImportError:
+                return None
+            importNumpy()
+            # the kernels release the GIL, they can run in parallel threads
+            jit = numba.njit(cache=True, nogil=True)
+            Kernels.compiled = {
+                'pathLength': jit(pathLengthKernel),
+                'mutation': jit(mutationKernel),
+                'twoOpt': jit(twoOptKernel),
+            }
+        return Kernels.compiled or None
+
+    @staticmethod
+    def cached():
+        '''
+        Look for the numba cache files of the kernels without importing numba
+        (about half a second). The names and the directories of the files are
+        the ones of numba: __pycache__ next to this file, NUMBA_CACHE_DIR or
+        the user cache directory; a file older than the source is obsolete.
+        :return: True if every kernel is compiled in this process or in the
+            numba cache
+        '''
+        if Kernels.compiled and all(kernel.signatures for kernel in Kernels.compiled.values()):
+            return True
+        for func in (pathLengthKernel, mutationKernel, twoOptKernel):
+            source = os.path.abspath(func.func_code.co_filename)
+            name = '%s.%s-%i.py%i%i%s.nbi' % (os.path.splitext(os.path.basename(source))[0], func.__name__,
+                                              func.func_code.co_firstlineno, sys.version_info[0],
+                                              sys.version_info[1], getattr(sys, 'abiflags', ''))
+            subpath = os.path.dirname(source).lstrip(os.path.sep)
+            directories = [os.path.join(os.path.dirname(source), '__pycache__'),
+                           os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                                        'numba', subpath)]
+            if os.environ.get('NUMBA_CACHE_DIR'):
+                directories.insert(0, os.path.join(os.environ['NUMBA_CACHE_DIR'], subpath))
+            mtime = os.path.getmtime(source)
+            files = [os.path.join(directory, name) for directory in directories]
+            if not [f for f in files if os.path.exists(f) and os.path.getmtime(f) >= mtime]:
+                return False
+        return True
+
+    @staticmethod
+    def warmUp(compiled):
+        '''
+        Compile (and cache) the kernels with all the types given by the
+        solver, by running them on a small instance
+        :param compiled: kernels returned by load
+        :return: n/a
+        '''
+        cities = [(str(i), i % 4, i / 4) for i in xrange(12)]
+        dist_matrix = Genetic.createDistMatrix(cities)
+        neighbours = SpatialGrid(array('d', [c[1] for c in cities]), array('d', [c[2] for c in cities])).neighboursLists(4)
+        kernels = Kernels(compiled, dist_matrix, neighbours, 0)
+        for path in (range(len(cities)), MyPathRanked(range(len(cities)), dist_matrix).path):
+            kernels.pathLength(path)
+            kernels.mutation(path, 0.5)
+            kernels.twoOpt(path, Genetic.pathLength(path, dist_matrix), dist_matrix, neighbours)
+
+    def __init__(self, compiled, dist_matrix, neighbours, seed=None):
+        '''
+        :param compiled: kernels returned by load
+        :param dist_matrix: distance matrix of the cities
+        :param neighbours: neighbours lists of the cities
+        :param seed: seed of the random numbers of the mutation
+        '''
+        self.compiled = compiled
+        self.dist_matrix = numpy.array(dist_matrix, dtype=float)
+        # the lists are padded with -1 to make a 2-D array
+        k = max([len(n) for n in neighbours] + [1])
+        self.neighbours = numpy.full((len(neighbours), k), -1, dtype=numpy.int64)
+        for city, n in enumerate(neighbours):
+            self.neighbours[city, :len(n)] = n
+        self.np_rng = numpy.random.RandomState(seed)
+
+    @staticmethod
+    def asArray(path):
+        '''
+        :param path: list or array of cities indices
+        :return: numpy view (array) or copy (list) of the path
+        '''
+        if isinstance(path, array):
+            return numpy.frombuffer(path, dtype=Kernels.DTYPES[path.typecode])
+        return numpy.array(path, dtype=numpy.int64)
+
+    def pathLength(self, path):
+        return self.compiled['pathLength'](Kernels.asArray(path), self.dist_matrix)
+
+    def mutation(self, path, percent=0.5, rand=None):
+        '''
+        Same as Genetic.mutation with random numbers drawn by batch
+        :param rand: random numbers generator in [0, 1) seeding the batch
+            (ex: in a thread), None to use the generator of the kernels
+        '''
+        if not (0 <= percent <= 1):
+            raise AttributeError('percent is  not in range')
+        np_rng = self.np_rng if rand == None else numpy.random.RandomState(int(rand() * 4294967296))
+        randoms = np_rng.random_sample(2 * int(percent * len(path)))
+        return self.compiled['mutation'](Kernels.asArray(path), randoms).tolist()
+
+    def twoOpt(self, path, rank, dist_matrix, neighbours, deadline=None, active=None):
+        '''
+        Same as Genetic.twoOpt, dist_matrix and neighbours are the ones given
+        to the constructor
+        '''
+        l = len(path)
+        if l < 4:
+            return rank, 0
+        p = numpy.array(path, dtype=numpy.int64)
+        position = numpy.empty(l, dtype=numpy.int64)
+        position[p] = numpy.arange(l)
+        cities, queued = Genetic.activeQueue(path, active)
+        queue = numpy.zeros(l, dtype=numpy.int64)
+        queue[:len(cities)] = list(cities)
+        queued = numpy.array(queued, dtype=numpy.bool_)
+        head, count = 0, len(cities)
+        moves = 0
+        while count > 0:
+            if deadline != None and time.time() > deadline:
+                break
+            rank, m, head, count = self.compiled['twoOpt'](p, position, rank, self.dist_matrix, self.neighbours,
+                                                           queue, queued, head, count, Kernels.CHECKS)
+            moves += m
+        if moves:
+            Genetic.replacePath(path, p)
+        return rank, moves
+
+
 # ==============================================================================
 #  CUSTOM CLASSES
 # ==============================================================================
@@ -121,30 +1605,195 @@ class Darwin(object):
     Execute the genetic algorithm in a given time
     '''
 
+    SEEDINGS = ('random', 'nearest', 'greedy', 'spacefilling', 'christofides')
+    # the solver ranks its paths with Darwin.pathLength (see Kernels)
+    USE_KERNELS = True
+
+    # above this number of cities there is no dense distance matrix
+    LARGE_INSTANCE = 2000
+    # default options of the large instances: few paths, seeded and improved
+    # with the candidate edges of short neighbours lists
+    LARGE_OPTIONS = {
+        'pop_number': 6,
+        'neighbours_count': 6,
+        'seeding': {'greedy': 0.5, 'spacefilling': 0.5},
+    }
+
     def __init__(self, **kwargs):
+        kwargs = self.largeOptions(kwargs)
         self.max_time_s = float(kwargs.get('max_time_s', 0))
+        # the time budget starts at start_time (ex: when ga_solve was called),
+        # else when the solver is created
+        self.scheduler = Scheduler(self.max_time_s, kwargs.get('start_time', time.time()))
+        self.deadline = None
+        # every solver has its own random generator: seed None for a random
+        # seed, stream for an independent sequence of the same seed (ex: islands)
+        self.rng = Darwin.createRandom(kwargs.get('seed', None), kwargs.get('stream', 0))
+        # batched generator of the vectorised engine
+        self.np_rng = None
         self.cities_list = kwargs.get('cities_list', [])
+        self.xs = array('d', [c[1] for c in self.cities_list])
+        self.ys = array('d', [c[2] for c in self.cities_list])
+        # the matrix of a large instance computes the distances when they are read
+        self.large_instance = kwargs.get('large_instance', len(self.cities_list) > Darwin.LARGE_INSTANCE)
+        if self.large_instance:
+            self.dist_matrix = CoordinatesMatrix(self.xs, self.ys)
+        else:
+            self.dist_matrix = Genetic.createDistMatrix(self.cities_list)
+        self.grid = SpatialGrid(self.xs, self.ys)
         self.pop_number = kwargs.get('pop_number', 10)
         self.func_gui = kwargs.get('func_gui', False)
-        self.listElitSize = kwargs.get('listElitSize', self.pop_number / 10)
+        self.island = kwargs.get('island', None)
+        self.stats = kwargs.get('stats', None)
+        self.metrics = kwargs.get('metrics', None)
+        # at least the best path is kept (the small populations of large instances)
+        self.listElitSize = kwargs.get('listElitSize', max(1, self.pop_number / 10))
+        self.neighbours_count = kwargs.get('neighbours_count', 10)
+        self.neighbours_lists = self.grid.neighboursLists(self.neighbours_count)
+        self.seeding = Darwin.parseSeeding(kwargs.get('seeding', 'random'))
+        # the steady state mode selects by tournament unless told otherwise
+        self.selection = Selection(kwargs.get('selection', 'tournament' if kwargs.get('steady_state') else 'rank'),
+                                   kwargs.get('tournament_size', 2))
+        if self.large_instance and self.seeding.get('christofides', 0) > 0:
+            # the minimum spanning tree needs all the distances
+            raise AttributeError('christofides seeding is not available for large instances')
         l = len(self.cities_list)
+        # default size: at most 64 MB of fingerprints
+        cache_size = kwargs.get('fitness_cache_size', min(10000, (1 << 26) / max(1, 2 * l)))
+        self.fitness_cache = FitnessCache(cache_size) if cache_size > 0 else None
+        self.unique_population = kwargs.get('unique_population', True)
+        # compiled kernels: 'auto' uses them when numba is installed, the
+        # instance and the time budget are large enough to pay for them and
+        # they are already compiled (the compilation would eat the time
+        # budget), 'numba' or 'python' to force
+        self.kernels = None
+        kernels = kwargs.get('kernels', 'auto')
+        if kernels not in ('auto', 'numba', 'python'):
+            raise AttributeError('unknown kernels %s' % kernels)
+        worth_it = (not self.large_instance and l >= Kernels.MIN_CITIES and
+                    (self.max_time_s <= 0 or self.max_time_s >= Kernels.MIN_TIME))
+        if self.USE_KERNELS and (kernels == 'numba' or (kernels == 'auto' and worth_it)):
+            cached = Kernels.cached()
+            compiled = None
+            if kernels == 'numba' or cached:
+                compiled = Kernels.load()
+            elif verbose:
+                print "numba kernels not in the numba cache: pure Python functions (run once with kernels=numba)"
+            if compiled == None and kernels == 'numba':
+                raise ImportError('numba is required by kernels=numba')
+            if self.large_instance and kernels == 'numba':
+                raise AttributeError('the numba kernels need the dense distance matrix')
+            if compiled != None and not cached:
+                Kernels.warmUp(compiled)
+            if compiled != None:
+                self.kernels = Kernels(compiled, self.dist_matrix, self.neighbours_lists, self.rng.getrandbits(32))
         self.optimal_iteration = int(log(l) * l) + 1
         self.stagnation_counter_max = 50
+        # checkpoint file written every checkpoint_interval seconds
+        self.checkpoint_file = kwargs.get('checkpoint', None)
+        self.checkpoint_interval = kwargs.get('checkpoint_interval', 30.0)
+        self.resume = kwargs.get('resume', False)
 
     def initialisation(self):
         '''
-        Create a starting pool of random path
+        Create a starting pool of path (see createInitialPaths)
         :return: n/a
         '''
         self.paths_list = []
-        self.elit = []
-        for i in xrange(self.pop_number):
-            path = Genetic.createPath(len(self.cities_list), self.cities_list, True)
-            self.paths_list.extend([MyPathRanked(path)])
+        for path in self.createInitialPaths():
+            self.paths_list.extend([MyPathRanked(path, self.dist_matrix)])
 
-        for i in self.paths_list:
-            i.ranking()
+        self.rankPaths(self.paths_list)
         self.paths_list = sorted(self.paths_list, key=MyPathRanked.getRank)
+        # the best seeds are kept even if they are not selected
+        self.elit = self.paths_list[:self.listElitSize]
+
+    def largeOptions(self, kwargs):
+        '''
+        :param kwargs: options of the solver
+        :return: options completed with LARGE_OPTIONS if the instance is large
+        '''
+        l = len(kwargs.get('cities_list', []))
+        if not kwargs.get('large_instance', l > Darwin.LARGE_INSTANCE):
+            return kwargs
+        options = dict(self.LARGE_OPTIONS)
+        options.update(kwargs)
+        return options
+
+    @staticmethod
+    def createRandom(seed=None, stream=0):
+        '''
+        :param seed: seed of the generator, None for a random seed
+        :param stream: index of an independent sequence for the same seed
+        :return: Random generator
+        '''
+        rng = Random(seed)
+        if stream:
+            rng.jumpahead(stream)
+        return rng
+
+    @staticmethod
+    def parseSeeding(seeding):
+        '''
+        :param seeding: name of a seeding strategy, dict {strategy: ratio} or
+            string "strategy:ratio,strategy:ratio"
+        :return: dict {strategy: ratio of the starting pool}
+        '''
+        if isinstance(seeding, basestring):
+            if ':' not in seeding:
+                seeding = {seeding: 1.0}
+            else:
+                seeding = dict((name, float(ratio)) for name, ratio in
+                               (item.split(':') for item in seeding.split(',')))
+        for name, ratio in seeding.items():
+            if name not in Darwin.SEEDINGS:
+                raise AttributeError('unknown seeding %s' % name)
+            if not (0 <= ratio <= 1):
+                raise AttributeError('seeding ratio is not in range')
+        if sum(seeding.values()) > 1 + 1e-9:
+            raise AttributeError('seeding ratios sum is greater than 1')
+        return dict(seeding)
+
+    def createInitialPaths(self):
+        '''
+        Create the paths of the starting pool, mixing the seeding strategies
+        with their ratio, the rest of the pool is random:
+        - random: random paths
+        - nearest: nearest neighbour paths from random starting cities
+        - greedy: greedy edge path
+        - spacefilling: path following a Hilbert curve
+        - christofides: shortcut eulerian circuit of the minimum spanning
+          tree plus a greedy matching, from random starting cities
+        The greedy and spacefilling paths are unique, their copies get a few
+        swaps to keep the pool diverse.
+        :return: list of pop_number paths of cities indices
+        '''
+        l = len(self.cities_list)
+        indices = range(l)
+        rand = self.rng.random
+        paths = []
+        for strategy in Darwin.SEEDINGS:
+            count = min(int(round(self.seeding.get(strategy, 0) * self.pop_number)), self.pop_number - len(paths))
+            if strategy == 'random' or count <= 0 or l == 0:
+                continue
+            if strategy == 'nearest':
+                for i in xrange(count):
+                    paths.append(Genetic.nearestNeighbourPath(self.grid, int(rand() * l)))
+            elif strategy == 'christofides':
+                graph = Genetic.christofidesGraph(self.dist_matrix)
+                for i in xrange(count):
+                    paths.append(Genetic.eulerShortcutPath(graph, int(rand() * l)))
+            else:
+                if strategy == 'greedy':
+                    path = Genetic.greedyEdgePath(self.grid, self.neighbours_lists)
+                else:
+                    path = Genetic.spaceFillingCurvePath(self.xs, self.ys)
+                paths.append(path)
+                for i in xrange(count - 1):
+                    paths.append(Genetic.mutation(path, min(1.0, 2.0 / l), rand))
+        while len(paths) < self.pop_number:
+            paths.append(Genetic.createPath(l, indices, True, rand))
+        return paths
 
     def runAlgorithm(self):
         '''
@@ -152,32 +1801,84 @@ class Darwin(object):
         '''
         raise Exception("This method is not override !")
 
+    def finish(self):
+        '''
+        Called at the end of run, release the resources of the solver
+        :return: n/a
+        '''
+        pass
+
     def run(self):
         timeout = False
         ln_log_n_reach = False
         cpt_iteration = 0
         cpt_stagnation = 0
 
-        self.initialisation()
-        startTime = time.time()
-        bestPath = self.runAlgorithm()
+        scheduler = self.scheduler
+        runStartTime = time.time()
+        self.deadline = scheduler.deadline
+        full_pop_number = self.pop_number
+        checkpoint = None
+        # last state of the full population, written at the end of the run
+        full_state = None
+        state = None
+        if self.checkpoint_file != None:
+            checkpoint = Checkpoint(self.checkpoint_file, self.checkpoint_interval)
+            if self.resume:
+                state = checkpoint.read(len(self.cities_list))
+        if state != None:
+            self.setState(state)
+            bestPath = MyPathRanked(state['best'], self.dist_matrix, state['best_rank'])
+            cpt_iteration = state['iteration']
+            cpt_stagnation = state['stagnation']
+            if verbose:
+                print "RESUME at generation %i" % cpt_iteration
+        else:
+            self.initialisation()
+            scheduler.startGeneration()
+            bestPath = self.runAlgorithm()
+            scheduler.endGeneration()
+        if self.island != None:
+            self.island.report(self, bestPath, cpt_iteration + 1)
+        if self.stats != None:
+            self.stats['history'] = [(time.time() - runStartTime, bestPath.getRank())]
 
         while not timeout:
+            # the last generations get a smaller population to end in time
+            scale = scheduler.scale()
+            if checkpoint != None and self.pop_number == full_pop_number:
+                full_state = self.getState(bestPath, cpt_iteration, cpt_stagnation)
+            if scale < 1:
+                self.pop_number = max(2, int(full_pop_number * scale))
+
+            scheduler.startGeneration()
             newBestPath = self.runAlgorithm()
+            scheduler.endGeneration()
 
             if Darwin.isNewBetterThanOld(newBestPath.getRank(), bestPath.getRank()):
                 bestPath = newBestPath
                 cpt_stagnation = 0
+                if self.island != None:
+                    # the generation before the loop and this one are not in cpt_iteration yet
+                    self.island.report(self, bestPath, cpt_iteration + 2)
+                if self.stats != None:
+                    self.stats['history'].append((time.time() - runStartTime, bestPath.getRank()))
             else:
                 cpt_stagnation += 1
 
-            endTime = time.time()
+            if self.island != None:
+                self.island.exchange(self, cpt_iteration)
 
-            if self.func_gui != None:
-                self.func_gui(bestPath.path)
+            # the snapshot only shares the paths, the file is written by an other thread
+            if checkpoint != None and checkpoint.due():
+                checkpoint.save(self.getState(bestPath, cpt_iteration, cpt_stagnation))
 
-            # stop on time out if set
-            if (self.max_time_s > 0 and endTime - startTime > self.max_time_s - 0.1):
+            # only the improvements are drawn
+            if self.func_gui and cpt_stagnation == 0:
+                self.func_gui(self.getCities(bestPath.path))
+
+            # stop on time out if set, or when not even a fifth of a generation fits
+            if self.max_time_s > 0 and (scheduler.expired() or scheduler.scale() < 0.2):
                 if verbose:
                     print "QUIT by timeout"
                 timeout = True
@@ -193,7 +1894,153 @@ class Darwin(object):
                         print "QUIT by stagnation before n*ln(n)"
                     timeout = True
 
-        return bestPath.getRank(), bestPath.path
+        if self.stats != None:
+            self.stats['generations'] = cpt_iteration + 1
+            if self.fitness_cache != None:
+                self.stats['fitness_cache_hit_rate'] = self.fitness_cache.hitRate()
+
+        if checkpoint != None:
+            # a resumed search must not start from the shrunk population of the
+            # last generations, only the best path found since is kept
+            if self.pop_number < full_pop_number and full_state != None:
+                full_state['best'], full_state['best_rank'] = bestPath.path, bestPath.getRank()
+            else:
+                full_state = self.getState(bestPath, cpt_iteration, cpt_stagnation)
+            checkpoint.close(full_state)
+
+        self.finish()
+        self.pop_number = full_pop_number
+
+        # the rank may drift from the incremental updates of the local search
+        bestPath.ranking()
+        return bestPath.getRank(), self.getCities(bestPath.path)
+
+    def getCities(self, path):
+        '''
+        :param path: path of cities indices
+        :return: path of cities tuples
+        '''
+        return [self.cities_list[i] for i in path]
+
+    def getState(self, bestPath, iteration, stagnation):
+        '''
+        Snapshot of the search for a checkpoint, the paths are not copied
+        (they are never modified once in the population)
+        :param bestPath: best MyPathRanked so far
+        :param iteration: generations counter
+        :param stagnation: generations since the last improvement
+        :return: dict read by Checkpoint.write and setState
+        '''
+        paths, ranks, elit, elit_ranks = self.getPopulation()
+        return {'cities_count': len(self.cities_list),
+                'paths': paths, 'ranks': ranks, 'elit': elit, 'elit_ranks': elit_ranks,
+                'best': bestPath.path, 'best_rank': bestPath.getRank(),
+                'iteration': iteration, 'stagnation': stagnation,
+                'random': self.rng.getstate(),
+                'numpy_random': self.np_rng.get_state() if self.np_rng != None else None}
+
+    def setState(self, state):
+        '''
+        Restore the population and the random generators of a checkpoint
+        :param state: dict returned by getState or Checkpoint.read
+        :return: n/a
+        '''
+        self.setPopulation(state['paths'], state['ranks'], state['elit'], state['elit_ranks'])
+        self.rng.setstate(state['random'])
+        if self.np_rng != None and state['numpy_random'] != None:
+            self.np_rng.set_state(state['numpy_random'])
+
+    def getPopulation(self):
+        '''
+        :return: paths, ranks, elit paths, elit ranks
+        '''
+        return ([p.path for p in self.paths_list], [p.getRank() for p in self.paths_list],
+                [p.path for p in self.elit], [p.getRank() for p in self.elit])
+
+    def setPopulation(self, paths, ranks, elit, elit_ranks):
+        '''
+        :param paths: paths of cities indices, sorted from the best
+        :param ranks: length of every path
+        :param elit: paths of the elit
+        :param elit_ranks: length of every elit path
+        :return: n/a
+        '''
+        self.paths_list = [MyPathRanked(path, self.dist_matrix, rank) for path, rank in zip(paths, ranks)]
+        self.elit = [MyPathRanked(path, self.dist_matrix, rank) for path, rank in zip(elit, elit_ranks)]
+
+    def pathLength(self, path):
+        '''
+        :param path: path of cities indices
+        :return: length of the closed path (compiled kernel if available)
+        '''
+        if self.kernels != None:
+            return self.kernels.pathLength(path)
+        return Genetic.pathLength(path, self.dist_matrix)
+
+    def rankPaths(self, paths):
+        '''
+        Rank the paths whose rank is not known, using the fitness cache
+        :param paths: list of MyPathRanked
+        :return: number of paths really ranked (not found in the cache)
+        '''
+        cache = self.fitness_cache
+        evaluations = 0
+        for p in paths:
+            if not p.dirty:
+                continue
+            if cache == None:
+                p.setRank(self.pathLength(p.path))
+                evaluations += 1
+                continue
+            key = FitnessCache.fingerprint(p.path)
+            rank = cache.get(key)
+            if rank == None:
+                p.setRank(self.pathLength(p.path))
+                cache.put(key, p.rank)
+                evaluations += 1
+            else:
+                p.setRank(rank)
+        return evaluations
+
+    def selectSurvivors(self, paths):
+        '''
+        :param paths: list of MyPathRanked
+        :return: the pop_number best paths, without duplicated paths (same
+            cities cycle) while there are enough different paths
+        '''
+        paths = sorted(paths, key=MyPathRanked.getRank)
+        if not self.unique_population:
+            return paths[:self.pop_number]
+        survivors = []
+        duplicates = []
+        seen = set()
+        for p in paths:
+            key = FitnessCache.fingerprint(p.path)
+            if key in seen:
+                duplicates.append(p)
+            else:
+                seen.add(key)
+                survivors.append(p)
+                if len(survivors) == self.pop_number:
+                    return survivors
+        return survivors + duplicates[:self.pop_number - len(survivors)]
+
+    def getElitPaths(self):
+        '''
+        :return: paths of the elit, as lists of cities indices
+        '''
+        return [list(p.path) for p in self.elit]
+
+    def addMigrants(self, paths):
+        '''
+        Insert paths coming from an other population, the worst paths are dropped
+        :param paths: list of paths of cities indices
+        :return: n/a
+        '''
+        for path in paths:
+            self.paths_list.extend([MyPathRanked(path, self.dist_matrix)])
+        self.rankPaths(self.paths_list)
+        self.paths_list = self.selectSurvivors(self.paths_list)
 
     @staticmethod
     def isNewBetterThanOld(new, old):
@@ -228,100 +2075,592 @@ class Darwin(object):
         :param rankedPath:
         :return: True if path is valid, else False
         '''
-        for city in self.cities_list:
-            if city not in rankedPath.path:
-                return False
-        return True
+        l = len(self.cities_list)
+        return len(rankedPath.path) == l and set(rankedPath.path) == set(xrange(l))
 
 class DarwinForCities(Darwin):
     '''
     Class for handling a genetic algorthm implementation
     '''
 
+    CROSSOVERS = ('ox', 'pmx', 'erx', 'pivot', 'none')
+    MUTATIONS = ('swap', 'doublebridge')
+    LOCAL_SEARCHES = ('2opt', 'oropt', '3opt', 'chained')
+
+    # on a large instance a crossover or a swap mutation breaks the whole
+    # path, a double bridge only changes 3 edges and keeps the local search local
+    # the local search of a seeded path takes tens of seconds on these sizes:
+    # it is spread over the generations
+    LARGE_OPTIONS = dict(Darwin.LARGE_OPTIONS, crossover='none', mutation='doublebridge',
+                         local_search='2opt+oropt', local_search_time=1.0)
+
     def __init__(self, **kwargs):
+        kwargs = self.largeOptions(kwargs)
         Darwin.__init__(self, **kwargs)
+        self.crossover = kwargs.get('crossover', 'ox')
+        if self.crossover not in DarwinForCities.CROSSOVERS:
+            raise AttributeError('unknown crossover %s' % self.crossover)
+        rand = self.rng.random
+        self.func_crossover = {
+            'ox': lambda path1, path2, rand=rand: Genetic.crossPathOX(path1, path2, rand=rand),
+            'pmx': lambda path1, path2, rand=rand: Genetic.crossPathPMX(path1, path2, rand=rand),
+            'erx': lambda path1, path2, rand=rand: Genetic.crossPathERX(path1, path2, rand),
+            'pivot': lambda path1, path2, rand=rand: Genetic.crossPathWithPivot(path1, path2, rand()),
+            'none': None,
+        }[self.crossover]
+        # a single child, for the steady state
+        self.func_crossover_child = {
+            'ox': lambda path1, path2, rand=rand:
+                Genetic.orderCrossChild(path1, path2, *Genetic.crossSegment(len(path1), rand)),
+            'pmx': lambda path1, path2, rand=rand:
+                Genetic.mappedCrossChild(path1, path2, *Genetic.crossSegment(len(path1), rand)),
+            'erx': lambda path1, path2, rand=rand: Genetic.edgeCrossChild(path1, path2, path1[0], rand),
+            # the second child only costs two slices
+            'pivot': lambda path1, path2, rand=rand: Genetic.crossPathWithPivot(path1, path2, rand())[0],
+            'none': None,
+        }[self.crossover]
+        self.mutation = kwargs.get('mutation', 'swap')
+        if self.mutation not in DarwinForCities.MUTATIONS:
+            raise AttributeError('unknown mutation %s' % self.mutation)
+        if self.kernels != None:
+            self.func_mutation = self.kernels.mutation
+        else:
+            self.func_mutation = lambda path, percent, rand=rand: Genetic.mutation(path, percent, rand)
+
+        # local searches applied in turn to the new paths, see Genetic.twoOpt
+        self.local_search = kwargs.get('local_search', '2opt')
+        if isinstance(self.local_search, basestring):
+            self.local_search = [name for name in self.local_search.split('+') if name]
+        for name in self.local_search:
+            if name not in DarwinForCities.LOCAL_SEARCHES:
+                raise AttributeError('unknown local search %s' % name)
+        # time budget of the local searches in every generation (None: no limit)
+        self.local_search_time = kwargs.get('local_search_time', None)
+        kicks = kwargs.get('local_search_kicks', 20)
+        twoOpt = self.kernels.twoOpt if self.kernels != None else Genetic.twoOpt
+        # every search takes the random generator of the caller (see createOffspring)
+        self.func_local_searches = [{
+            '2opt': lambda path, rank, dist_matrix, neighbours, deadline, active, rand:
+                twoOpt(path, rank, dist_matrix, neighbours, deadline, active),
+            'oropt': lambda path, rank, dist_matrix, neighbours, deadline, active, rand:
+                Genetic.orOpt(path, rank, dist_matrix, neighbours, deadline, active),
+            '3opt': lambda path, rank, dist_matrix, neighbours, deadline, active, rand:
+                Genetic.threeOpt(path, rank, dist_matrix, neighbours, deadline, active),
+            'chained': lambda path, rank, dist_matrix, neighbours, deadline, active, rand:
+                Genetic.chainedLocalSearch(path, rank, dist_matrix, neighbours, deadline, active, kicks, rand),
+        }[name] for name in self.local_search]
+
+        # steady state: the children replace the worst paths one at a time
+        self.steady_state = kwargs.get('steady_state', False)
+        # threads creating the offspring of the pairs of parents, worth it when
+        # the kernels release the GIL (numba) or on a free-threaded python
+        self.threads = kwargs.get('threads', 1)
+        if self.threads < 1:
+            raise AttributeError('threads is not in range')
+        self.thread_pool = None
+
+    def localSearch(self, p, deadline, active=None, rand=None):
+        '''
+        Apply the local searches in turn to a path
+        :param p: MyPathRanked, modified in place
+        :param deadline: time.time() after which the search stops
+        :param active: cities checked first (all the cities if None)
+        :param rand: random numbers generator in [0, 1) (the generator of
+            the solver if None)
+        :return: number of moves done
+        '''
+        if rand == None:
+            rand = self.rng.random
+        rank = p.getRank()
+        moves = 0
+        for search in self.func_local_searches:
+            rank, m = search(p.path, rank, self.dist_matrix, self.neighbours_lists, deadline, active, rand)
+            moves += m
+        p.setRank(rank)
+        p.optimized = deadline == None or time.time() <= deadline
+        return moves
 
     def runAlgorithm(self):
         '''
-        This function implements the genetic algorithm
+        This function implements the genetic algorithm, the offspring of the
+        pairs of selected paths are created by createOffspring, in turn or by
+        a pool of threads (see threads)
         :return: the best path encountered during genetic modification
         '''
+        if self.steady_state:
+            return self.runSteadyState()
+        metrics = self.metrics
+        if metrics:
+            t = metrics.start()
+
+        # Selection (the population is sorted, see Selection)
+        selected = [self.paths_list[i].copy() for i in
+                    self.selection.select(len(self.paths_list), self.pop_number, self.rng.random)]
+        if metrics:
+            t = metrics.stage('selection', t)
+
+        # every pair gets its own random generator, seeded here, so the result
+        # does not depend on the number of threads
+        deadline = self.scheduler.stageDeadline(self.local_search_time,
+                                                self.scheduler.estimate('after_local_search'))
+        tasks = [(selected[i:i + 2], self.rng.getrandbits(32), deadline) for i in xrange(0, len(selected), 2)]
+        if self.threads > 1:
+            if self.thread_pool == None:
+                self.thread_pool = ThreadPool(self.threads)
+            offspring = self.thread_pool.map(self.createOffspring, tasks)
+        else:
+            offspring = map(self.createOffspring, tasks)
         self.selected_paths = []
-
-        # Selection
-        totalLength = 0
-        for i in range(self.pop_number):
-            totalLength += i
-
-        for n in range(self.pop_number):
-            randomLen = int(random() * totalLength)
-            stopLen = 0
-            for i in range(len(self.paths_list)):
-                stopLen += len(self.paths_list) - i
-                if stopLen > randomLen:
-                    self.selected_paths.extend([MyPathRanked(self.paths_list[i].path)])
-                    self.selected_paths[-1].ranking()
-                    break
-
-        # mutation and cross
-        new_path_list = []
-        for i in range(0, len(self.selected_paths), 2):
-            curr1 = self.selected_paths[i]
-            curr2 = self.selected_paths[i + 1]
-            newPath1 = Genetic.mutation(curr1.path, random())
-            newPath2 = Genetic.mutation(curr2.path, random())
-            new_path_list.extend([MyPathRanked(newPath1)])
-            new_path_list[-1].ranking()
-            new_path_list.extend([MyPathRanked(newPath2)])
-            new_path_list[-1].ranking()
-
-            pivot = random()
-            newPath1, newPath2 = Genetic.crossPathWithPivot(curr1.path, curr2.path, pivot)
-            new_path_list.extend([MyPathRanked(newPath1)])
-            new_path_list[-1].ranking()
-            new_path_list.extend([MyPathRanked(newPath2)])
-            new_path_list[-1].ranking()
-
-        self.selected_paths.extend(new_path_list)
-        self.selected_paths = self.getValidPathList(self.selected_paths)
-
-        # 2opt
-        for p in self.selected_paths:
-            for i in range(len(p) - 3):
-                for j in range(i + 2, len(p) - 1):
-                    d_ab = Genetic.dist(p.path[i], p.path[i + 1])
-                    d_cd = Genetic.dist(p.path[j], p.path[j + 1])
-                    d_ac = Genetic.dist(p.path[i], p.path[j])
-                    d_bd = Genetic.dist(p.path[i + 1], p.path[j + 1])
-                    if (d_ab + d_cd > d_ac + d_bd):
-                        Genetic.swap(p.path, i + 1, j)
-                        p.ranking()
+        for paths, stages in offspring:
+            self.selected_paths.extend(paths)
+            if metrics:
+                metrics.merge(stages)
+        t = local_search_end = time.time()
 
         if self.elit:
             self.selected_paths.extend((self.elit))
-        self.selected_paths = sorted(self.selected_paths, key=MyPathRanked.getRank)
-        self.selected_paths = self.selected_paths[:self.pop_number]
-        self.elit = copy.deepcopy(self.selected_paths[:self.listElitSize])
+        self.selected_paths = self.selectSurvivors(self.selected_paths)
 
-        self.paths_list = copy.deepcopy(self.selected_paths)
+        # the survivors are never modified (see MyPathRanked), they are shared
+        # between the generations instead of being copied
+        self.elit = self.selected_paths[:self.listElitSize]
+        self.paths_list = self.selected_paths
+        self.scheduler.record('after_local_search', time.time() - local_search_end)
+        if metrics:
+            metrics.stage('survivors', t)
+            metrics.endGeneration([p.getRank() for p in self.paths_list])
 
         return self.selected_paths[0]
 
+    def createOffspring(self, task):
+        '''
+        Mutation, crossover, ranking and local search of a pair of selected
+        paths, may run in a thread of the pool
+        :param task: selected paths (2, or 1 for the last one), seed of the
+            random generator, deadline of the local search
+        :return: selected paths and their children, Metrics of the task (None
+            without metrics)
+        '''
+        parents, seed, deadline = task
+        rand = Random(seed).random
+        metrics = Metrics() if self.metrics else None
+        if metrics:
+            t = metrics.start()
+
+        # mutation, the local search of a kicked path starts at the ends of the kick
+        paths = list(parents)
+        kicked = {}
+        for p in parents:
+            if self.deadline != None and time.time() > self.deadline:
+                break
+            if self.mutation == 'swap':
+                paths.extend([MyPathRanked(self.func_mutation(p.path, rand(), rand), self.dist_matrix)])
+            else:
+                child = p.copy()
+                delta, kicked[id(child)] = Genetic.doubleBridge(child.path, self.dist_matrix, rand=rand)
+                child.setRank(child.getRank() + delta)
+                child.optimized = False
+                paths.extend([child])
+        if metrics:
+            t = metrics.stage('mutation', t)
+
+        # cross
+        if self.func_crossover and len(parents) == 2 and (self.deadline == None or time.time() <= self.deadline):
+            newPath1, newPath2 = self.func_crossover(parents[0].path, parents[1].path, rand)
+            paths.extend([MyPathRanked(newPath1, self.dist_matrix)])
+            paths.extend([MyPathRanked(newPath2, self.dist_matrix)])
+        if metrics:
+            t = metrics.stage('crossover', t)
+
+        # only the pivot crossover creates paths with missing cities
+        if self.crossover == 'pivot':
+            paths = self.getValidPathList(paths)
+            if metrics:
+                t = metrics.stage('validity', t)
+
+        # ranking
+        evaluations = self.rankPaths(paths)
+        if metrics:
+            metrics.count('fitness_evaluations', evaluations)
+            t = metrics.stage('ranking', t)
+
+        # local search, the copies of optimized parents are skipped
+        for p in paths:
+            if p.optimized or not self.func_local_searches:
+                continue
+            if deadline != None and time.time() > deadline:
+                break
+            moves = self.localSearch(p, deadline, kicked.get(id(p)), rand)
+            if metrics:
+                metrics.count('local_search_moves', moves)
+        if metrics:
+            metrics.stage('local_search', t)
+        return paths, metrics
+
+    def finish(self):
+        if self.thread_pool != None:
+            self.thread_pool.close()
+            self.thread_pool.join()
+            self.thread_pool = None
+
+    def runSteadyState(self):
+        '''
+        Steady state version of the genetic algorithm: pop_number children are
+        created one at a time, each from parents chosen by self.selection
+        (tournament by default), and replaces the worst path of the population
+        if it is shorter. The population stays sorted (ranks is searched by
+        bisection), which is what the selection expects.
+        :return: the best path of the population
+        '''
+        metrics = self.metrics
+        if metrics:
+            t = metrics.start()
+        rand = self.rng.random
+        paths = self.paths_list
+        if len(paths) > self.pop_number:
+            del paths[self.pop_number:]
+        ranks = [p.getRank() for p in paths]
+        seen = set(FitnessCache.fingerprint(p.path) for p in paths) if self.unique_population else None
+        deadline = self.scheduler.stageDeadline(self.local_search_time)
+        evaluations = 0
+        moves = 0
+        replaced = 0
+
+        for n in xrange(self.pop_number):
+            if self.deadline != None and time.time() > self.deadline:
+                break
+            count = len(paths)
+            parent = paths[self.selection.select(count, 1, rand)[0]]
+            active = None
+            if self.func_crossover_child and rand() < 0.5:
+                other = paths[self.selection.select(count, 1, rand)[0]]
+                child = MyPathRanked(self.func_crossover_child(parent.path, other.path), self.dist_matrix)
+            elif self.mutation == 'swap':
+                child = MyPathRanked(self.func_mutation(parent.path, rand()), self.dist_matrix)
+            else:
+                child = parent.copy()
+                delta, active = Genetic.doubleBridge(child.path, self.dist_matrix, rand=rand)
+                child.setRank(child.getRank() + delta)
+                child.optimized = False
+            # only the pivot crossover creates paths with missing cities
+            if self.crossover == 'pivot' and not self.isValid(child):
+                continue
+            evaluations += self.rankPaths([child])
+            if self.func_local_searches and (deadline == None or time.time() <= deadline):
+                moves += self.localSearch(child, deadline, active)
+
+            rank = child.getRank()
+            if count >= self.pop_number and rank >= ranks[-1]:
+                continue
+            if seen != None:
+                key = FitnessCache.fingerprint(child.path)
+                if key in seen:
+                    continue
+                seen.add(key)
+            if count >= self.pop_number:
+                ranks.pop()
+                worst = paths.pop()
+                if seen != None:
+                    seen.discard(FitnessCache.fingerprint(worst.path))
+            k = bisect_right(ranks, rank)
+            ranks.insert(k, rank)
+            paths.insert(k, child)
+            replaced += 1
+
+        self.elit = paths[:self.listElitSize]
+        if metrics:
+            metrics.count('fitness_evaluations', evaluations)
+            metrics.count('local_search_moves', moves)
+            metrics.count('replacements', replaced)
+            metrics.stage('steady_state', t)
+            metrics.endGeneration(ranks)
+        return paths[0]
+
+
+class DarwinForCitiesNumpy(Darwin):
+    '''
+    Genetic algorithm working on the whole population at once: the population
+    is a 2-D array of cities indices (one row per path) and the ranking,
+    the selection, the mutation and the 2-opt moves are batched array
+    operations
+    '''
+
+    # the paths are ranked by rankPopulation, the kernels are never used
+    USE_KERNELS = False
+    # a mutation swaps between 1 and MUTATION_SWAPS pairs of cities
+    MUTATION_SWAPS = 3
+
+    def __init__(self, **kwargs):
+        if importNumpy() is None:
+            raise ImportError('numpy is required by DarwinForCitiesNumpy')
+        Darwin.__init__(self, **kwargs)
+        # seeded from the generator of the solver, so the seed drives both
+        self.np_rng = numpy.random.RandomState(self.rng.getrandbits(32))
+        if self.large_instance:
+            self.np_xs = numpy.array(self.xs)
+            self.np_ys = numpy.array(self.ys)
+        else:
+            self.np_dist_matrix = numpy.array(self.dist_matrix, dtype=float)
+        # neighbours lists padded with the nearest neighbour (see improvePopulation)
+        k = max([len(n) for n in self.neighbours_lists] + [1])
+        self.np_neighbours = numpy.array([list(n) + list(n[:1]) * (k - len(n)) if len(n) else [city] * k
+                                          for city, n in enumerate(self.neighbours_lists)], dtype=int)
+        # 2-opt moves tried on every path in each generation (0: none)
+        self.improvement_steps = kwargs.get('improvement_steps', len(self.cities_list))
+        self.local_search_time = kwargs.get('local_search_time', None)
+
+    def initialisation(self):
+        '''
+        Create a starting pool of path (see Darwin.createInitialPaths)
+        :return: n/a
+        '''
+        l = len(self.cities_list)
+        if set(self.seeding) <= set(['random']):
+            population = numpy.argsort(self.np_rng.random_sample((self.pop_number, l)), axis=1)
+        else:
+            population = numpy.array(self.createInitialPaths(), dtype=int).reshape(self.pop_number, l)
+        self.population, self.ranks = self.sortPopulation(population, self.rankPopulation(population))
+        self.elit = self.population[:self.listElitSize]
+        self.elit_ranks = self.ranks[:self.listElitSize]
+
+    def rankPopulation(self, population):
+        '''
+        :param population: 2-D array of paths
+        :return: array with the length of every path
+        '''
+        following = numpy.roll(population, -1, axis=1)
+        if self.large_instance:
+            return numpy.hypot(self.np_xs[population] - self.np_xs[following],
+                               self.np_ys[population] - self.np_ys[following]).sum(axis=1)
+        return self.np_dist_matrix[population, following].sum(axis=1)
+
+    def distances(self, cities1, cities2):
+        '''
+        :param cities1: array of cities indices
+        :param cities2: array of cities indices
+        :return: array of the distances between cities1[i] and cities2[i]
+        '''
+        if self.large_instance:
+            return numpy.hypot(self.np_xs[cities1] - self.np_xs[cities2], self.np_ys[cities1] - self.np_ys[cities2])
+        return self.np_dist_matrix[cities1, cities2]
+
+    def sortPopulation(self, population, ranks):
+        '''
+        :param population: 2-D array of paths
+        :param ranks: length of every path
+        :return: population and ranks sorted from the best path to the worst
+        '''
+        order = numpy.argsort(ranks, kind='mergesort')
+        return population[order], ranks[order]
+
+    def mutatePopulation(self, population):
+        '''
+        Batched version of Genetic.mutation: every path get between 1 and
+        MUTATION_SWAPS pairs of cities swaped (more would give random paths)
+        :param population: 2-D array of paths
+        :return: mutated copy of the population
+        '''
+        rows_count, l = population.shape
+        hybrid = population.copy()
+        mutation_count = self.np_rng.randint(1, self.MUTATION_SWAPS + 1, rows_count)
+        rows = numpy.arange(rows_count)
+        for n in xrange(mutation_count.max() if rows_count else 0):
+            active = rows[mutation_count > n]
+            randomIndex1 = self.np_rng.randint(0, l, len(active))
+            randomIndex2 = self.np_rng.randint(0, l, len(active))
+            tmp1 = hybrid[active, randomIndex1]
+            hybrid[active, randomIndex1] = hybrid[active, randomIndex2]
+            hybrid[active, randomIndex2] = tmp1
+        return hybrid
+
+    def improvePopulation(self, population, steps, deadline=None):
+        '''
+        Batched 2-opt: at each step every path tries the move joining a random
+        city to one of its neighbours, the improving moves are applied at once
+        :param population: 2-D array of paths, modified in place
+        :param steps: number of moves tried on every path
+        :param deadline: time.time() after which the moves stop
+        :return: number of moves done
+        '''
+        rows_count, l = population.shape
+        if l < 5 or not rows_count:
+            return 0
+        rows = numpy.arange(rows_count)
+        index = numpy.arange(l)
+        position = numpy.empty_like(population)
+        position[rows[:, None], population] = index
+        k = self.np_neighbours.shape[1]
+        moves = 0
+        for step in xrange(steps):
+            if deadline != None and step % 16 == 0 and time.time() > deadline:
+                break
+            i = self.np_rng.randint(0, l, rows_count)
+            a = population[rows, i]
+            b = population[rows, (i + 1) % l]
+            c = self.np_neighbours[a, self.np_rng.randint(0, k, rows_count)]
+            j = position[rows, c]
+            d = population[rows, (j + 1) % l]
+            gain = self.distances(a, b) + self.distances(c, d) - self.distances(a, c) - self.distances(b, d)
+            better = rows[gain > 1e-9]
+            if not len(better):
+                continue
+            # edges (a, b) and (c, d) replaced by (a, c) and (b, d): the
+            # cities between the two edges are reversed
+            lo = numpy.minimum(i, j)[better, None] + 1
+            hi = numpy.maximum(i, j)[better, None]
+            source = numpy.where((index >= lo) & (index <= hi), lo + hi - index, index)
+            population[better] = population[better[:, None], source]
+            position[better[:, None], population[better]] = index
+            moves += len(better)
+        return moves
+
+    def runAlgorithm(self):
+        '''
+        This function implements the genetic algorithm
+        :return: the best path encountered during genetic modification
+        '''
+        metrics = self.metrics
+        if metrics:
+            t = metrics.start()
+
+        # Selection (the population is sorted, see Selection)
+        picks = self.selection.selectBatch(len(self.population), self.pop_number, self.np_rng)
+        selected = self.population[picks]
+        selected_ranks = self.ranks[picks]
+        if metrics:
+            t = metrics.stage('selection', t)
+
+        # mutation
+        mutated = self.mutatePopulation(selected)
+        if metrics:
+            t = metrics.stage('mutation', t)
+
+        # local search
+        if self.improvement_steps > 0:
+            moves = self.improvePopulation(mutated, self.improvement_steps,
+                                           self.scheduler.stageDeadline(self.local_search_time))
+            if metrics:
+                metrics.count('local_search_moves', moves)
+                t = metrics.stage('local_search', t)
+
+        # ranking
+        mutated_ranks = self.rankPopulation(mutated)
+        if metrics:
+            metrics.count('fitness_evaluations', len(mutated))
+            t = metrics.stage('ranking', t)
+
+        population = numpy.vstack((selected, mutated, self.elit))
+        ranks = numpy.concatenate((selected_ranks, mutated_ranks, self.elit_ranks))
+        population, ranks = self.sortPopulation(population, ranks)
+        self.population = population[:self.pop_number]
+        self.ranks = ranks[:self.pop_number]
+        self.elit = self.population[:self.listElitSize]
+        self.elit_ranks = self.ranks[:self.listElitSize]
+        if metrics:
+            metrics.stage('survivors', t)
+            metrics.endGeneration(self.ranks)
+
+        return MyPathRanked(self.population[0].tolist(), self.dist_matrix, float(self.ranks[0]))
+
+    def getElitPaths(self):
+        '''
+        :return: paths of the elit, as lists of cities indices
+        '''
+        return self.elit.tolist()
+
+    def getPopulation(self):
+        '''
+        :return: paths, ranks, elit paths, elit ranks (arrays are never modified in place)
+        '''
+        return self.population, self.ranks, self.elit, self.elit_ranks
+
+    def setPopulation(self, paths, ranks, elit, elit_ranks):
+        l = len(self.cities_list)
+        self.population = numpy.array(paths, dtype=int).reshape(len(paths), l)
+        self.ranks = numpy.array(ranks, dtype=float)
+        self.elit = numpy.array(elit, dtype=int).reshape(len(elit), l)
+        self.elit_ranks = numpy.array(elit_ranks, dtype=float)
+
+    def addMigrants(self, paths):
+        '''
+        Insert paths coming from an other population, the worst paths are dropped
+        :param paths: list of paths of cities indices
+        :return: n/a
+        '''
+        if not paths:
+            return
+        migrants = numpy.array(paths, dtype=self.population.dtype)
+        population = numpy.vstack((self.population, migrants))
+        ranks = numpy.concatenate((self.ranks, self.rankPopulation(migrants)))
+        population, ranks = self.sortPopulation(population, ranks)
+        self.population = population[:self.pop_number]
+        self.ranks = ranks[:self.pop_number]
+
 
 class MyPathRanked(object):
     '''
-    Class for handling ranked paths
+    Class for handling ranked paths of cities indices
+
+    The path is stored in a compact array of unsigned integers and its rank
+    is cached: it is only computed again when the path has been replaced
+    (setPath) or when ranking() is called explicitly.
+
+    Once a path is in a population (paths_list, elit) it must not be
+    modified anymore: the operators build a new path (Genetic.mutation,
+    the crossovers, copy() before the local search) so the survivors can be shared
+    between generations without copy.
     '''
-    def __init__(self, path):
-        self.path = path
-        self.rank = 0
+    __slots__ = ('path', 'dist_matrix', 'rank', 'dirty', 'optimized')
+
+    def __init__(self, path, dist_matrix, rank=None, optimized=False):
+        self.path = array(MyPathRanked.typecode(len(path)), path)
+        self.dist_matrix = dist_matrix
+        self.rank = rank if rank != None else 0
+        self.dirty = rank == None
+        # True once the local search can not improve the path anymore
+        self.optimized = optimized
+
+    @staticmethod
+    def typecode(length):
+        '''
+        :param length: number of cities
+        :return: smallest array typecode able to store the cities indices
+        '''
+        return 'H' if length <= 1 << 16 else 'I'
 
     def __repr__(self):
         return "MyPathRanked : " + str(self.rank)
 
     def getRank(self):
+        if self.dirty:
+            self.ranking()
         return self.rank
 
+    def setRank(self, rank):
+        '''
+        Set the rank of a path modified in place (ex: by the local search)
+        :param rank: length of the path
+        :return: n/a
+        '''
+        self.rank = rank
+        self.dirty = False
+
+    def setPath(self, path):
+        '''
+        Replace the path, the rank will be computed again when needed
+        :param path: path of cities indices
+        :return: n/a
+        '''
+        self.path = array(self.path.typecode, path)
+        self.dirty = True
+        self.optimized = False
+
+    def copy(self):
+        '''
+        :return: new MyPathRanked with a copy of the path and the same rank
+        '''
+        return MyPathRanked(self.path, self.dist_matrix, None if self.dirty else self.rank, self.optimized)
+
     def __len__(self):
         return len(self.path)
 
@@ -330,18 +2669,271 @@ class MyPathRanked(object):
         Sum of the distance between all the town of the path
         :return: n/a
         '''
-        dist = 0.0
-        previous_town = None
+        self.rank = Genetic.pathLength(self.path, self.dist_matrix)
+        self.dirty = False
 
-        for town in self.path:
-            if previous_town != None:
-                dist += Genetic.dist(town, previous_town)
-            previous_town = town
 
-        first_town = self.path[0]
-        last_town = self.path[len(self.path) - 1]
-        dist += Genetic.dist(last_town, first_town)
-        self.rank = dist
+class FitnessCache(object):
+    '''
+    Bounded LRU cache: fingerprint of a path -> length of the path
+    '''
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # the offspring may be ranked by several threads (see DarwinForCities.threads)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(path):
+        '''
+        The fingerprint is the same for all the rotations and both directions
+        of a cycle: it starts at city 0 and goes toward its smallest neighbour
+        :param path: array of cities indices (see MyPathRanked)
+        :return: fingerprint of the path (string)
+        '''
+        k = path.index(0)
+        path = path[k:] + path[:k]
+        if len(path) > 2 and path[1] > path[-1]:
+            path = path[:1] + path[:0:-1]
+        return path.tostring()
+
+    def get(self, key):
+        '''
+        :return: length of the path with fingerprint key, None if unknown
+        '''
+        with self.lock:
+            rank = self.entries.pop(key, None)
+            if rank == None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries[key] = rank
+            return rank
+
+    def put(self, key, rank):
+        with self.lock:
+            self.entries[key] = rank
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def hitRate(self):
+        '''
+        :return: ratio of the lookups found in the cache
+        '''
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+
+# ==============================================================================
+#  ISLANDS
+# ==============================================================================
+
+class Island(object):
+    '''
+    Link between the population of a worker process and the other islands
+    of an Archipelago
+    '''
+
+    TOPOLOGIES = ('ring', 'full', 'random')
+
+    def __init__(self, index, inboxes, results, migration_interval=10, topology='ring'):
+        if topology not in Island.TOPOLOGIES:
+            raise AttributeError('unknown topology %s' % topology)
+        self.index = index
+        self.inboxes = inboxes
+        self.results = results
+        self.migration_interval = max(1, int(migration_interval))
+        self.topology = topology
+
+    def targets(self, rand=random):
+        '''
+        :param rand: random numbers generator in [0, 1)
+        :return: indices of the islands receiving the elit of this island
+        '''
+        count = len(self.inboxes)
+        others = [i for i in xrange(count) if i != self.index]
+        if not others:
+            return []
+        if self.topology == 'ring':
+            return [(self.index + 1) % count]
+        if self.topology == 'random':
+            return [others[int(rand() * len(others))]]
+        return others
+
+    def report(self, darwin, bestPath, generations):
+        '''
+        Send a new best path of this island to the Archipelago
+        :param darwin: population of this island
+        :param bestPath: best MyPathRanked found by this island
+        :param generations: number of generations done by this island
+        :return: n/a
+        '''
+        path = list(bestPath.path)
+        self.results.put(('best', self.index, Genetic.pathLength(path, darwin.dist_matrix), path, generations))
+
+    def exchange(self, darwin, generation):
+        '''
+        Every migration_interval generations, send the elit to the target
+        islands and insert the migrants received from the other islands. The
+        number of generations done is sent to the Archipelago too, the 'done'
+        message of the end may arrive after its timeout.
+        :param darwin: population of this island
+        :param generation: generation counter of Darwin.run (without the
+            generation before its loop)
+        :return: n/a
+        '''
+        if (generation + 1) % self.migration_interval != 0:
+            return
+        self.results.put(('generations', self.index, None, None, generation + 2))
+        elit = darwin.getElitPaths()
+        if elit:
+            for target in self.targets(darwin.rng.random):
+                self.inboxes[target].put(elit)
+        migrants = []
+        try:
+            while True:
+                migrants.extend(self.inboxes[self.index].get_nowait())
+        except Queue.Empty:
+            pass
+        darwin.addMigrants(migrants)
+
+
+def islandWorker(solver_class, kwargs, index, inboxes, results, deadline, migration_interval, topology):
+    '''
+    Entry point of an island process: evolve one population until the
+    deadline and send the best paths to the Archipelago
+    '''
+    kwargs = dict(kwargs)
+    # with a seed, every island gets its own stream; without, the generator
+    # created in this process gets a new random seed
+    kwargs['stream'] = kwargs.get('stream', 0) + index
+    if deadline != None:
+        kwargs['max_time_s'] = max(deadline - time.time(), 0.1)
+    kwargs['func_gui'] = None
+    kwargs['island'] = Island(index, inboxes, results, migration_interval, topology)
+    kwargs['stats'] = {}
+    if kwargs.get('checkpoint') != None:
+        kwargs['checkpoint'] = '%s.%i' % (kwargs['checkpoint'], index)
+    solver_class(**kwargs).run()
+    results.put(('done', index, None, None, kwargs['stats']['generations']))
+
+
+class Archipelago(object):
+    '''
+    Island model: islands_count populations evolve in their own process and
+    periodically exchange their elit. Same interface as Darwin.run.
+    '''
+
+    # seconds between two checks of the islands processes
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, **kwargs):
+        self.max_time_s = float(kwargs.get('max_time_s', 0))
+        self.cities_list = kwargs.get('cities_list', [])
+        self.func_gui = kwargs.get('func_gui', False)
+        self.stats = kwargs.pop('stats', None)
+        self.start_time = kwargs.pop('start_time', None)
+        # the islands run in other processes, their metrics are not collected
+        kwargs.pop('metrics', None)
+        self.solver_class = kwargs.pop('solver_class', DarwinForCities)
+        self.islands_count = int(kwargs.pop('islands_count', multiprocessing.cpu_count()))
+        self.migration_interval = kwargs.pop('migration_interval', 10)
+        self.topology = kwargs.pop('topology', 'ring')
+        if self.topology not in Island.TOPOLOGIES:
+            raise AttributeError('unknown topology %s' % self.topology)
+        self.kwargs = kwargs
+
+    def run(self):
+        startTime = self.start_time if self.start_time != None else time.time()
+        deadline = startTime + self.max_time_s if self.max_time_s > 0 else None
+        inboxes = [multiprocessing.Queue() for i in xrange(self.islands_count)]
+        results = multiprocessing.Queue()
+        workers = []
+        for index in xrange(self.islands_count):
+            p = multiprocessing.Process(target=islandWorker,
+                                        args=(self.solver_class, self.kwargs, index, inboxes, results,
+                                              deadline, self.migration_interval, self.topology))
+            p.daemon = True
+            p.start()
+            workers.append(p)
+
+        self.bestRank, self.bestPath = None, None
+        self.history = []
+        # last number of generations sent by each island
+        generations = [0] * self.islands_count
+        running = set(xrange(self.islands_count))
+        while running:
+            timeout = Archipelago.POLL_INTERVAL
+            if deadline != None:
+                timeout = min(timeout, deadline - 0.05 - time.time())
+                if timeout <= 0:
+                    if verbose:
+                        print "QUIT by timeout, %i islands still running" % len(running)
+                    break
+            try:
+                kind, index, rank, path, count = results.get(True, timeout)
+            except Queue.Empty:
+                # an island which raised never sends 'done'
+                for index in list(running):
+                    if not workers[index].is_alive() and workers[index].exitcode != 0:
+                        if verbose:
+                            print "island %i died, exit code %s" % (index, workers[index].exitcode)
+                        running.discard(index)
+                continue
+            generations[index] = max(generations[index], count)
+            if kind == 'done':
+                running.discard(index)
+            elif kind == 'best':
+                self.addBest(rank, path, startTime)
+
+        # messages sent just before the timeout
+        try:
+            while True:
+                kind, index, rank, path, count = results.get_nowait()
+                generations[index] = max(generations[index], count)
+                if kind == 'best':
+                    self.addBest(rank, path, startTime)
+        except Queue.Empty:
+            pass
+
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+
+        if self.bestPath == None:
+            # no island reported a path in time (ex: the initialisation of
+            # every island took the whole time), build one here
+            if verbose:
+                print "no path from the islands, nearest neighbour path"
+            xs = array('d', [c[1] for c in self.cities_list])
+            ys = array('d', [c[2] for c in self.cities_list])
+            path = Genetic.nearestNeighbourPath(SpatialGrid(xs, ys), 0) if self.cities_list else []
+            self.addBest(Genetic.pathLength(path, CoordinatesMatrix(xs, ys)), path, startTime)
+
+        if self.stats != None:
+            # the islands stopped by the timeout are counted up to their last message
+            self.stats['generations'] = sum(generations)
+            self.stats['history'] = self.history
+
+        return self.bestRank, [self.cities_list[i] for i in self.bestPath]
+
+    def addBest(self, rank, path, startTime):
+        '''
+        Keep a path sent by an island if it is better than the best path
+        :param rank: length of the path
+        :param path: path of cities indices
+        :param startTime: start time of the run (history)
+        :return: n/a
+        '''
+        if self.bestRank != None and not Darwin.isNewBetterThanOld(rank, self.bestRank):
+            return
+        self.bestRank, self.bestPath = rank, path
+        self.history.append((time.time() - startTime, rank))
+        if self.func_gui:
+            self.func_gui([self.cities_list[i] for i in path])
 
 
 # ==============================================================================
@@ -351,47 +2943,398 @@ class MyPathRanked(object):
 class CitiesLoader:
     '''
     Class used t load a cities file
+
+    Two formats are read: one city per line ("name x y", separated by any
+    whitespace) and the NODE_COORD_SECTION of the TSPLIB files.
     '''
 
+    CACHE_MAGIC = 'BRCITIES1\n'
+    CHUNK_SIZE = 1 << 20
+
     @staticmethod
-    def getCitiesFromFile(fileName):
+    def getCitiesFromFile(fileName, cache=False):
         '''
         :param fileName:
+        :param cache: use (and create) the binary cache file of fileName
         :return: cities list
         '''
-        cities = []
+        names, xs, ys = CitiesLoader.loadCoordinates(fileName, cache)
+        toNumber = lambda v: int(v) if v.is_integer() else v
+        return [(name, toNumber(x), toNumber(y)) for name, x, y in zip(names, xs, ys)]
 
+    @staticmethod
+    def loadCoordinates(fileName, cache=False):
+        '''
+        Read the cities of a file into coordinates arrays, the file is read by
+        chunks of lines and every chunk is parsed at once
+        :param fileName:
+        :param cache: use (and create) the binary cache file of fileName
+        :return: names list, x array, y array
+        '''
+        if cache:
+            cities = CitiesLoader.readCache(fileName)
+            if cities != None:
+                return cities
+
+        names = []
+        xs = array('d')
+        ys = array('d')
         with open(fileName, 'r') as f:
-            for line in f:
-                word = line.split(' ')
-                city = (word[0], int(word[1]), int(word[2]))
-                cities.extend([city])
+            # header: TSPLIB keywords until the NODE_COORD_SECTION, or nothing
+            tsplib = False
+            lines = []
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                word = line.split()
+                if not word:
+                    continue
+                if word[0].upper().startswith('NODE_COORD_SECTION'):
+                    tsplib = True
+                    break
+                if ':' not in line and word[0].upper() != 'EOF':
+                    lines.append(line)
+                    break
+
+            while True:
+                if not lines:
+                    lines = f.readlines(CitiesLoader.CHUNK_SIZE)
+                    if not lines:
+                        break
+                finished = False
+                if tsplib:
+                    # the section stops with EOF or with an other section
+                    for k, line in enumerate(lines):
+                        if line.lstrip()[:1].isalpha():
+                            lines = lines[:k]
+                            finished = True
+                            break
+                word = ''.join(lines).split()
+                if len(word) % 3 != 0:
+                    raise ValueError('%s: every city needs a name, x and y' % fileName)
+                names.extend(word[0::3])
+                xs.extend(map(float, word[1::3]))
+                ys.extend(map(float, word[2::3]))
+                lines = []
+                if finished:
+                    break
+
+        if cache:
+            CitiesLoader.writeCache(fileName, names, xs, ys)
+        return names, xs, ys
+
+    @staticmethod
+    def getCacheFileName(fileName):
+        return fileName + '.cache'
+
+    @staticmethod
+    def readCache(fileName):
+        '''
+        Read the cities from the binary cache file, which is memory-mapped
+        :param fileName: cities file (not the cache file)
+        :return: names list, x array, y array or None if there is no up to date cache
+        '''
+        cacheName = CitiesLoader.getCacheFileName(fileName)
+        try:
+            if os.path.getmtime(cacheName) < os.path.getmtime(fileName):
+                return None
+        except OSError:
+            return None
+
+        with open(cacheName, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic = CitiesLoader.CACHE_MAGIC
+                if mm[:len(magic)] != magic:
+                    return None
+                pos = len(magic)
+                count = struct.unpack('<I', mm[pos:pos + 4])[0]
+                pos += 4
+                xs = array('d')
+                xs.fromstring(mm[pos:pos + 8 * count])
+                pos += 8 * count
+                ys = array('d')
+                ys.fromstring(mm[pos:pos + 8 * count])
+                pos += 8 * count
+                names = mm[pos:].split('\n') if count else []
+            finally:
+                mm.close()
+
+        if len(xs) != count or len(ys) != count or len(names) != count:
+            return None
+        return names, xs, ys
+
+    @staticmethod
+    def writeCache(fileName, names, xs, ys):
+        '''
+        Write the binary cache file of fileName:
+        magic, count (uint32), x (count doubles), y (count doubles), names
+        :return: n/a
+        '''
+        cacheName = CitiesLoader.getCacheFileName(fileName)
+        tmpName = cacheName + '.tmp'
+        with open(tmpName, 'wb') as f:
+            f.write(CitiesLoader.CACHE_MAGIC)
+            f.write(struct.pack('<I', len(names)))
+            xs.tofile(f)
+            ys.tofile(f)
+            f.write('\n'.join(names))
+        if os.path.exists(cacheName):
+            os.remove(cacheName)
+        os.rename(tmpName, cacheName)
+
+
+# ==============================================================================
+#  BACKGROUND WORKER
+# ==============================================================================
+
+class LatestValueWorker(object):
+    '''
+    Call a function in its own thread with the last submitted value only,
+    at most once per interval, so the caller never waits for it. The values
+    submitted between two calls are dropped.
+    '''
+
+    def __init__(self, func, interval=0.0):
+        self.func = func
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.value = None
+        self.pending = False
+        self.running = True
+        self.thread = threading.Thread(target=self.loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, value):
+        '''
+        Replace the value waiting for the function, never blocks
+        '''
+        with self.lock:
+            self.value = value
+            self.pending = True
+        self.event.set()
+
+    def loop(self):
+        last = 0.0
+        while self.running:
+            self.event.wait()
+            self.event.clear()
+            wait = last + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            with self.lock:
+                value, pending = self.value, self.pending
+                self.value, self.pending = None, False
+            if pending and self.running:
+                self.func(value)
+                last = time.time()
+
+    def stop(self):
+        '''
+        Stop the thread, the value still pending is dropped
+        '''
+        self.running = False
+        self.event.set()
+        self.thread.join()
+
+
+# ==============================================================================
+#  GUI
+# ==============================================================================
+
+class AsyncRenderer(LatestValueWorker):
+    '''
+    Draw the last submitted path at most fps times per second, so the
+    solver never waits for the drawing (see LatestValueWorker)
+    '''
+
+    def __init__(self, func_draw, fps=20):
+        LatestValueWorker.__init__(self, func_draw, 1.0 / fps)
+
+
+# ==============================================================================
+#  CHECKPOINT
+# ==============================================================================
+
+class Checkpoint(object):
+    '''
+    Binary checkpoint file of a Darwin search (see Darwin.getState):
+    magic, cities count, paths count, elit count, iteration, stagnation
+    (uint32), ranks (doubles) and paths (uint32) of the population, of the
+    elit and of the best path, then the states of the random generators.
+
+    The file is written by a background thread (LatestValueWorker) so the
+    search only pays for the snapshot, at most once per interval.
+    '''
 
-        return cities
+    MAGIC = 'BRCHECK1\n'
+
+    def __init__(self, fileName, interval=30.0):
+        self.fileName = fileName
+        self.interval = interval
+        self.next_time = time.time() + interval
+        self.writer = None
+
+    def due(self):
+        return time.time() >= self.next_time
+
+    def save(self, state):
+        '''
+        Write the state in the background, never blocks
+        :param state: dict returned by Darwin.getState
+        :return: n/a
+        '''
+        if self.writer == None:
+            self.writer = LatestValueWorker(self.write, self.interval)
+        self.writer.submit(state)
+        self.next_time = time.time() + self.interval
+
+    def close(self, state=None):
+        '''
+        Stop the background writer and write the last state
+        :return: n/a
+        '''
+        if self.writer != None:
+            self.writer.stop()
+            self.writer = None
+        if state != None:
+            self.write(state)
+
+    @staticmethod
+    def writePaths(f, paths):
+        if numpy is not None and isinstance(paths, numpy.ndarray):
+            f.write(paths.astype('<u4').tostring())
+        else:
+            for path in paths:
+                array('I', path).tofile(f)
+
+    def write(self, state):
+        '''
+        Write the state in a temporary file renamed at the end, so an
+        interruption never leaves a broken checkpoint
+        :return: n/a
+        '''
+        tmpName = self.fileName + '.tmp'
+        with open(tmpName, 'wb') as f:
+            f.write(Checkpoint.MAGIC)
+            f.write(struct.pack('<IIIII', state['cities_count'], len(state['paths']), len(state['elit']),
+                                state['iteration'], state['stagnation']))
+            array('d', state['ranks']).tofile(f)
+            Checkpoint.writePaths(f, state['paths'])
+            array('d', state['elit_ranks']).tofile(f)
+            Checkpoint.writePaths(f, state['elit'])
+            f.write(struct.pack('<d', state['best_rank']))
+            Checkpoint.writePaths(f, [state['best']])
+
+            version, keys, gauss = state['random']
+            f.write(struct.pack('<I', version))
+            array('I', keys).tofile(f)
+            f.write(struct.pack('<?d', gauss != None, gauss or 0.0))
+
+            numpy_state = state['numpy_random']
+            f.write(struct.pack('<?', numpy_state != None))
+            if numpy_state != None:
+                name, keys, pos, has_gauss, cached_gaussian = numpy_state
+                keys.astype('<u4').tofile(f)
+                f.write(struct.pack('<IId', pos, has_gauss, cached_gaussian))
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+        os.rename(tmpName, self.fileName)
+
+    def read(self, cities_count):
+        '''
+        :param cities_count: number of cities of the search to resume
+        :return: state dict (see Darwin.getState) or None if there is no checkpoint file
+        '''
+        if not os.path.exists(self.fileName):
+            return None
+        with open(self.fileName, 'rb') as f:
+            data = f.read()
+        if data[:len(Checkpoint.MAGIC)] != Checkpoint.MAGIC:
+            raise AttributeError('%s is not a checkpoint file' % self.fileName)
+        pos = len(Checkpoint.MAGIC)
+
+        def take(typecode, count):
+            values = array(typecode)
+            size = values.itemsize * count
+            values.fromstring(data[pos:pos + size])
+            return values, pos + size
+
+        (l, paths_count, elit_count, iteration, stagnation) = struct.unpack('<IIIII', data[pos:pos + 20])
+        pos += 20
+        if l != cities_count:
+            raise AttributeError('checkpoint %s is not for %i cities' % (self.fileName, cities_count))
+        state = {'cities_count': l, 'iteration': iteration, 'stagnation': stagnation}
+        state['ranks'], pos = take('d', paths_count)
+        paths, pos = take('I', paths_count * l)
+        state['paths'] = [paths[i * l:(i + 1) * l] for i in xrange(paths_count)]
+        state['elit_ranks'], pos = take('d', elit_count)
+        elit, pos = take('I', elit_count * l)
+        state['elit'] = [elit[i * l:(i + 1) * l] for i in xrange(elit_count)]
+        state['best_rank'] = struct.unpack('<d', data[pos:pos + 8])[0]
+        pos += 8
+        state['best'], pos = take('I', l)
+
+        version = struct.unpack('<I', data[pos:pos + 4])[0]
+        pos += 4
+        keys, pos = take('I', 625)
+        has_gauss, gauss = struct.unpack('<?d', data[pos:pos + 9])
+        pos += 9
+        state['random'] = (version, tuple(keys), gauss if has_gauss else None)
+
+        state['numpy_random'] = None
+        if struct.unpack('<?', data[pos:pos + 1])[0]:
+            pos += 1
+            keys, pos = take('I', 624)
+            key_pos, has_gauss, cached_gaussian = struct.unpack('<IId', data[pos:pos + 16])
+            if numpy is not None:
+                state['numpy_random'] = ('MT19937', numpy.array(keys, dtype=numpy.uint32),
+                                         key_pos, has_gauss, cached_gaussian)
+        return state
 
 
 # ==============================================================================
 #  GA_SOLVE
 # ==============================================================================
 
-def ga_solve(file=None, gui=False, maxtime=0):
+ENGINES = {
+    'python': DarwinForCities,
+    'numpy': DarwinForCitiesNumpy,
+}
+
+
+def ga_solve(file=None, gui=False, maxtime=0, engine='python', **kwargs):
     '''
 
     :param file: cities filename
     :param gui: gui showing or not
     :param maxtime: maxtime allowed for best path finding throught genetic modification
+    :param engine: name of the genetic algorithm implementation (see ENGINES)
+    :param kwargs: extra parameters given to the engine (pop_number, ...)
     :return: n/a
     '''
-    import pygame
-    from pygame.locals import KEYDOWN, QUIT, MOUSEBUTTONDOWN, K_RETURN, K_ESCAPE
-    import sys
+    kwargs.setdefault('start_time', time.time())
+    if engine not in ENGINES:
+        raise AttributeError('unknown engine %s' % engine)
+    solver = ENGINES[engine]
+    if kwargs.get('islands_count', 1) > 1:
+        kwargs['solver_class'] = solver
+        solver = Archipelago
 
     collecting = file == None
     listCities = []
     if file != None:
-        listCities = CitiesLoader.getCitiesFromFile(file)
+        listCities = CitiesLoader.getCitiesFromFile(file, kwargs.pop('cache', False))
 
     if gui or file == None:
+        # pygame is only imported when a window is opened
+        import pygame
+        from pygame.locals import KEYDOWN, QUIT, MOUSEBUTTONDOWN, K_RETURN, K_ESCAPE
+        import sys
+
         screen_x = 500
         screen_y = 500
 
@@ -432,6 +3375,8 @@ def ga_solve(file=None, gui=False, maxtime=0):
                         print (str(counting), pos[0], pos[1])
                         listCities.append((str(counting), pos[0], pos[1]))
                         drawEdition(listCities)
+            # the time budget starts once the cities are placed
+            kwargs['start_time'] = time.time()
 
         def drawRecherche(positions):
             positions = [x[1:] for x in positions]
@@ -444,8 +3389,12 @@ def ga_solve(file=None, gui=False, maxtime=0):
 
         if gui:
             drawRecherche(listCities)
-            d = DarwinForCities(cities_list=listCities, max_time_s=maxtime, func_gui=drawRecherche)
-            bestlen, listCities = d.run()
+            renderer = AsyncRenderer(drawRecherche, kwargs.pop('gui_fps', 20))
+            d = solver(cities_list=listCities, max_time_s=maxtime, func_gui=renderer.submit, **kwargs)
+            try:
+                bestlen, listCities = d.run()
+            finally:
+                renderer.stop()
             drawRecherche(listCities)
 
             return bestlen, [x[0] for x in listCities]
@@ -453,17 +3402,141 @@ def ga_solve(file=None, gui=False, maxtime=0):
             pygame.display.quit()
             drawRecherche = lambda x: None
 
-            d = DarwinForCities(cities_list=listCities, max_time_s=maxtime, func_gui=drawRecherche)
+            d = solver(cities_list=listCities, max_time_s=maxtime, func_gui=drawRecherche, **kwargs)
             bestlen, listCities = d.run()
             return bestlen, [x[0] for x in listCities]
     else:
         drawRecherche = lambda x: None
 
-        d = DarwinForCities(cities_list=listCities, max_time_s=maxtime, func_gui=drawRecherche)
+        d = solver(cities_list=listCities, max_time_s=maxtime, func_gui=drawRecherche, **kwargs)
         bestlen, listCities = d.run()
         return bestlen, [x[0] for x in listCities]
 
 
+# ==============================================================================
+#  BATCH
+# ==============================================================================
+
+# cities of the files already loaded by this worker process (LRU)
+batch_cities_cache = OrderedDict()
+BATCH_CITIES_CACHE_SIZE = 32
+
+
+def batchInit():
+    '''
+    Entry point of a batch worker process: the forked workers must not share
+    the state of the global random generator
+    '''
+    seed()
+
+
+def batchCities(fileName, cache=False):
+    '''
+    :param fileName: cities file
+    :param cache: use the binary cache file (see CitiesLoader)
+    :return: cities list, read only once per worker process
+    '''
+    listCities = batch_cities_cache.pop(fileName, None)
+    if listCities == None:
+        listCities = CitiesLoader.getCitiesFromFile(fileName, cache)
+        if len(batch_cities_cache) >= BATCH_CITIES_CACHE_SIZE:
+            batch_cities_cache.popitem(False)
+    batch_cities_cache[fileName] = listCities
+    return listCities
+
+
+def batchWorker(job):
+    '''
+    Solve one instance of a batch, without gui
+    :param job: index, instance (file name or cities list), maxtime, engine, kwargs
+    :return: index, best length, cities names of the best path
+    '''
+    index, instance, maxtime, engine, kwargs = job
+    kwargs = dict(kwargs)
+    # the time budget starts when the worker gets the instance
+    kwargs['start_time'] = time.time()
+    # the result of an instance does not depend on the worker solving it
+    kwargs['stream'] = kwargs.get('stream', 0) + index
+    cache = kwargs.pop('cache', False)
+    if isinstance(instance, basestring):
+        listCities = batchCities(instance, cache)
+    else:
+        listCities = list(instance)
+    d = ENGINES[engine](cities_list=listCities, max_time_s=maxtime, func_gui=None, **kwargs)
+    bestlen, listCities = d.run()
+    return index, bestlen, [x[0] for x in listCities]
+
+
+class BatchSolver(object):
+    '''
+    Solve many instances on a pool of worker processes. The workers live
+    as long as the BatchSolver, so the module, numpy and the cities files
+    already read are shared by all the instances they solve.
+    '''
+
+    def __init__(self, maxtime=0, engine='python', processes=None, **kwargs):
+        '''
+        :param maxtime: maxtime allowed for every instance
+        :param engine: name of the genetic algorithm implementation (see ENGINES)
+        :param processes: number of worker processes, default: cpu count
+        :param kwargs: extra parameters given to the engine (pop_number, cache, ...)
+        '''
+        if engine not in ENGINES:
+            raise AttributeError('unknown engine %s' % engine)
+        # the workers are daemonic, they can not start the islands processes
+        if kwargs.get('islands_count', 1) > 1:
+            raise AttributeError('islands_count is not in range')
+        for name in ('func_gui', 'metrics', 'stats', 'checkpoint'):
+            kwargs.pop(name, None)
+        self.maxtime = maxtime
+        self.engine = engine
+        self.kwargs = kwargs
+        self.pool = multiprocessing.Pool(processes, batchInit)
+
+    def solve(self, instances):
+        '''
+        :param instances: iterable of cities file names or cities lists
+        :return: iterator of (index of the instance, best length, cities
+            names of the best path), in the order the instances are solved
+        '''
+        jobs = ((index, instance, self.maxtime, self.engine, self.kwargs)
+                for index, instance in enumerate(instances))
+        return self.pool.imap_unordered(batchWorker, jobs)
+
+    def close(self):
+        '''
+        Wait for the instances still in the pool and stop the workers
+        '''
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        '''
+        Stop the workers at once, the instances not solved yet are dropped
+        '''
+        self.pool.terminate()
+        self.pool.join()
+
+
+def ga_solve_batch(instances, maxtime=0, engine='python', processes=None, **kwargs):
+    '''
+    Headless ga_solve of many instances (see BatchSolver)
+    :return: iterator of (index of the instance, best length, cities names)
+    '''
+    batch = BatchSolver(maxtime, engine, processes, **kwargs)
+    finished = False
+    try:
+        for result in batch.solve(instances):
+            yield result
+        finished = True
+    finally:
+        # the consumer stopped early (generator closed): don't solve the rest
+        if finished:
+            batch.close()
+        else:
+            batch.terminate()
+
+
 # ==============================================================================
 #  MAIN
 # ==============================================================================
@@ -474,14 +3547,29 @@ if __name__ == "__main__":
     import getopt
 
     def show_help():
-        print "USAGE : BitterRyter.py [--nogui] [--maxtime=] file"
+        print "USAGE : BitterRyter.py [--nogui] [--maxtime=] [--engine=python|numpy] [--popnumber=]"
+        print "       [--islands=] [--migration=] [--topology=ring|full|random]"
+        print "       [--crossover=ox|pmx|erx|pivot|none] [--mutation=swap|doublebridge]"
+        print "       [--seeding=strategy[:ratio],...] [--cache]"
+        print "       [--localsearch=2opt+oropt+3opt+chained] [--localsearchtime=]"
+        print "       [--metrics=file.json|file.csv] [--checkpoint=file] [--checkpointinterval=] [--resume]"
+        print "       [--selection=rank|tournament|sus] [--tournament=] [--steadystate]"
+        print "       [--kernels=auto|numba|python] [--threads=] [--processes=] [--seed=] [--large]"
+        print "       file [file ...]"
         exit()
 
     fileName = None
     gui = True
     max_time = 0
-
-    options_list = ["nogui", "maxtime="]
+    engine = 'python'
+    processes = None
+    solver_options = {}
+
+    options_list = ["nogui", "maxtime=", "engine=", "popnumber=",
+                    "islands=", "migration=", "topology=", "crossover=", "mutation=", "seeding=",
+                    "localsearch=", "localsearchtime=", "cache", "metrics=",
+                    "checkpoint=", "checkpointinterval=", "resume", "processes=", "seed=", "large",
+                    "steadystate", "tournament=", "selection=", "kernels=", "threads="]
     opt, arg = getopt.getopt(sys.argv[1:], "hv", options_list)
 
     if len(arg) == 1:
@@ -496,6 +3584,61 @@ if __name__ == "__main__":
             gui = False
         elif o == "--maxtime":
             max_time = a
+        elif o == "--engine":
+            engine = a
+        elif o == "--popnumber":
+            solver_options['pop_number'] = int(a)
+        elif o == "--islands":
+            solver_options['islands_count'] = int(a)
+        elif o == "--migration":
+            solver_options['migration_interval'] = int(a)
+        elif o == "--topology":
+            solver_options['topology'] = a
+        elif o == "--crossover":
+            solver_options['crossover'] = a
+        elif o == "--mutation":
+            solver_options['mutation'] = a
+        elif o == "--seeding":
+            solver_options['seeding'] = a
+        elif o == "--localsearch":
+            solver_options['local_search'] = a
+        elif o == "--localsearchtime":
+            solver_options['local_search_time'] = float(a)
+        elif o == "--cache":
+            solver_options['cache'] = True
+        elif o == "--metrics":
+            metricsFileName = a
+            solver_options['metrics'] = Metrics()
+        elif o == "--checkpoint":
+            solver_options['checkpoint'] = a
+        elif o == "--checkpointinterval":
+            solver_options['checkpoint_interval'] = float(a)
+        elif o == "--resume":
+            solver_options['resume'] = True
+        elif o == "--processes":
+            processes = int(a)
+        elif o == "--seed":
+            solver_options['seed'] = int(a)
+        elif o == "--large":
+            solver_options['large_instance'] = True
+        elif o == "--steadystate":
+            solver_options['steady_state'] = True
+        elif o == "--tournament":
+            solver_options['tournament_size'] = int(a)
+        elif o == "--selection":
+            solver_options['selection'] = a
+        elif o == "--kernels":
+            solver_options['kernels'] = a
+        elif o == "--threads":
+            solver_options['threads'] = int(a)
+
+    # several files: headless batch, one line per file as soon as it is solved
+    if len(arg) > 1:
+        for index, bestlenresult, pathresult in ga_solve_batch(arg, max_time, engine, processes, **solver_options):
+            print arg[index], bestlenresult
+        exit()
 
-    bestlenresult, pathresult = ga_solve(fileName, gui, max_time)
+    bestlenresult, pathresult = ga_solve(fileName, gui, max_time, engine, **solver_options)
+    if 'metrics' in solver_options:
+        solver_options['metrics'].dump(metricsFileName)
     print bestlenresult
@@ -41,6 +41,24 @@ tests = (
 # On tol�re un d�passement de 5% du temps imparti:
 tolerance = 0.05
 
+# Graines aléatoires: chaque test est exécuté une fois par graine
+seeds = (1, 2, 3)
+
+# Nombre de processus exécutant les tests en parallèle (None: un par coeur)
+processes = None
+
+# Chaque processus est fixé sur son propre coeur (si le système le permet)
+pinning = True
+
+# Le "temps pour atteindre l'objectif" est mesuré pour un objectif à 5% de la
+# meilleure longueur trouvée pour le problème (toutes exécutions confondues)
+target_gap = 0.05
+
+# Fichier JSON (un objet par ligne et par exécution) avec toutes les mesures
+jsonfile = 'results.jsonl'
+# ou, pour ne pas l'écrire :
+#jsonfile = None
+
 # Fichier dans lequel �crire les r�sultats
 import sys
 outfile = sys.stdout
@@ -58,8 +76,16 @@ gui = False
 # Cette partie n'a th�oriquement pas � �tre modifi�e
 
 import os
+import json
+import random
+import multiprocessing
 from time import time
-from math import hypot
+from math import hypot, sqrt
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 def dist(x1,y1,x2,y2):
     return hypot(x2 -x1,y2-y1)
@@ -101,49 +127,199 @@ def validate(filename, length, path, duration, maxtime):
 
 
 
-if __name__ == '__main__':
-    # R�cup�ration des diff�rentes impl�mentations
-    # On met les diff�rentes fonctions ga_solve() dans un dictionnaire index� par le nom du module correpsondant
-    # On en profite pour �crire la ligne d'en-t�te du fichier de sortie
+def set_affinity(cpu):
+    '''Fixe le processus courant sur le coeur cpu
 
-    solvers = {}
+    os.sched_setaffinity n'existe qu'à partir de Python 3.3: sinon psutil
+    est utilisé s'il est installé, ou l'appel système de la libc (Linux).
+    Lève une exception si aucun ne fonctionne.
+    '''
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, [cpu])
+        return
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        psutil.Process().cpu_affinity([cpu])
+        return
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (cpu // bits + 1))()
+    mask[cpu // bits] = 1 << (cpu % bits)
+    if libc.sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        raise OSError(ctypes.get_errno(), 'sched_setaffinity failed')
 
-    outfile.write('Test;')
 
-    for m in modules:
-        exec ("from %s import ga_solve" % m)
-        solvers[m] = ga_solve
-        outfile.write("%s;" % m)
+def pin(cpus):
+    '''Fixe le processus courant sur un coeur libre de la file cpus
 
-    outfile.write('\n')
+    retourne le coeur utilisé ou None si le système ne le permet pas
+    '''
+    cpu = cpus.get()
+    try:
+        set_affinity(cpu)
+    except Exception:
+        cpus.put(cpu)
+        return None
+    return cpu
+
+
+def run(case, cpus):
+    '''Exécute un cas (module, fichier, temps imparti, graine) dans un processus du pool
+
+    retourne un dictionnaire avec les mesures de l'exécution
+    '''
+    m, filename, maxtime, seed = case
+    cpu = pin(cpus) if pinning else None
+    result = {'module': m, 'file': filename, 'maxtime': maxtime, 'seed': seed, 'cpu': cpu}
+    try:
+        random.seed(seed)
+        try:
+            import numpy
+            numpy.random.seed(seed)
+        except ImportError:
+            pass
+        try:
+            solver = __import__(m).ga_solve
+        except Exception as e:
+            result['error'] = "Import failed: %r" % e
+            return result
+        except SystemExit:
+            result['error'] = "tried to quit!"
+            return result
+        # les solveurs qui acceptent un paramètre stats y indiquent le nombre
+        # de générations et l'historique (temps, longueur) des améliorations,
+        # ceux qui acceptent un paramètre seed utilisent leur propre générateur
+        stats = {}
+        options = {}
+        try:
+            from inspect import getargspec
+            spec = getargspec(solver)
+            if spec.keywords is not None or 'stats' in spec.args:
+                options['stats'] = stats
+            if spec.keywords is not None or 'seed' in spec.args:
+                options['seed'] = seed
+        except (ImportError, TypeError):
+            pass
+        try:
+            start = time()
+            length, path = solver(filename, gui, maxtime, **options)
+            duration = time() - start
+        except Exception as e:
+            result['error'] = "%r" % e
+        except SystemExit:
+            result['error'] = "tried to quit!"
+        else:
+            result['length'] = length
+            result['duration'] = duration
+            result['error'] = validate(filename, length, path, duration, maxtime)
+            if 'generations' in stats:
+                result['generations_per_s'] = stats['generations'] / duration
+            result['history'] = stats.get('history')
+        if resource is not None:
+            # maxtasksperchild=1: le maximum concerne cette seule exécution
+            result['peak_memory_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        if cpu is not None:
+            cpus.put(cpu)
+    return result
+
+
+def init_worker(queue):
+    global cpus
+    cpus = queue
 
-    # Cette partie effectue les tests proprement dits
-    # et rapporte les r�sultats dans outfile
 
+def run_in_worker(case):
+    return run(case, cpus)
+
+
+def summary(values):
+    '''retourne (nombre, moyenne, écart-type, min, médiane, max) des valeurs'''
+    values = sorted(v for v in values if v is not None)
+    n = len(values)
+    if not n:
+        return (0, None, None, None, None, None)
+    mean = sum(values) / float(n)
+    std = sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+    median = values[n // 2] if n % 2 else (values[n // 2 - 1] + values[n // 2]) / 2.0
+    return (n, mean, std, values[0], median, values[-1])
+
+
+def time_to_target(result, target):
+    '''retourne le temps de la première amélioration sous target, ou None'''
+    for t, length in result.get('history') or ():
+        if length <= target:
+            return t
+    return None
+
+
+if __name__ == '__main__':
+    # Les cas (module, problème, temps imparti, graine) sont répartis sur un
+    # pool de processus; chaque processus n'exécute qu'un cas (maxtasksperchild)
+    # pour que la mesure du pic mémoire lui soit propre.
+
+    cases = []
     for (filename, maxtime) in tests:
-        if verbose:
-            print ("--> %s, %d" % (filename, maxtime))
         # normalisation du nom de fichier (pour l'aspect multi-plateforme)
         filename = os.path.normcase(os.path.normpath(filename))
-        # �criture de l'en-t�te de ligne
-        outfile.write("%s (%ds);" % (filename, maxtime))
-        # Appel des solveurs proprement dits, v�rification et �criture des r�sultats
         for m in modules:
-            if verbose:
-                print ("## %s" % m)
-            try:
-                start = time()
-                length, path = solvers[m](filename, gui, maxtime)
-                duration = time()-start
-            except Exception as e:
-                    outfile.write("%r;" % e)
-            except SystemExit:
-                outfile.write("tried to quit!;")
-            else:
-                error = validate(filename, length, path, duration, maxtime)
-                if not error:
-                    outfile.write("%d;" % length)
-                else:
-                    outfile.write("%s;" % error)
-            outfile.flush()
-        outfile.write('\n')
+            for seed in seeds:
+                cases.append((m, filename, maxtime, seed))
+
+    count = processes or multiprocessing.cpu_count()
+    queue = multiprocessing.Queue()
+    for cpu in range(multiprocessing.cpu_count()):
+        queue.put(cpu)
+    pool = multiprocessing.Pool(count, init_worker, (queue,), maxtasksperchild=1)
+
+    results = []
+    json_out = open(jsonfile, 'w') if jsonfile else None
+    for result in pool.imap_unordered(run_in_worker, cases):
+        if verbose:
+            print ("--> %(file)s, %(maxtime)d, %(module)s, graine %(seed)s: %(error)s" % dict(result, error=result.get('error') or result.get('length')))
+        results.append(result)
+    pool.close()
+    pool.join()
+
+    unpinned = [r for r in results if r['cpu'] is None]
+    if pinning and unpinned:
+        sys.stderr.write("Warning: CPU pinning inactive for %d of %d runs "
+                         "(no sched_setaffinity, psutil or libc)\n" % (len(unpinned), len(results)))
+
+    # objectif par problème: meilleure longueur valide trouvée + target_gap
+    best = {}
+    for r in results:
+        if not r['error']:
+            best[r['file']] = min(best.get(r['file'], r['length']), r['length'])
+    for r in results:
+        r['time_to_target'] = None
+        if r['file'] in best:
+            r['time_to_target'] = time_to_target(r, best[r['file']] * (1 + target_gap))
+        if json_out:
+            json_out.write(json.dumps(r) + '\n')
+    if json_out:
+        json_out.close()
+
+    # Résumé statistique par (problème, temps imparti, module)
+    columns = ('length', 'duration', 'generations_per_s', 'time_to_target', 'peak_memory_kb')
+    outfile.write('Test;module;runs;errors')
+    for c in columns:
+        outfile.write(''.join(';%s %s' % (c, s) for s in ('mean', 'std', 'min', 'median', 'max')))
+    outfile.write('\n')
+    for (filename, maxtime) in tests:
+        filename = os.path.normcase(os.path.normpath(filename))
+        for m in modules:
+            runs = [r for r in results if (r['module'], r['file'], r['maxtime']) == (m, filename, maxtime)]
+            valid = [r for r in runs if not r['error']]
+            outfile.write("%s (%ds);%s;%d;%d" % (filename, maxtime, m, len(runs), len(runs) - len(valid)))
+            for c in columns:
+                n, mean, std, low, median, high = summary(r.get(c) for r in valid)
+                for v in (mean, std, low, median, high):
+                    outfile.write(";" if v is None else ";%.3f" % v)
+            outfile.write('\n')
+    outfile.flush()
@@ -0,0 +1,85 @@
+'''
+Benchmark of the cost of one generation of DarwinForCities.
+
+Compare the current population handling (survivors shared between the
+generations) with the former one, where the elit and the whole population
+were rebuilt with copy.deepcopy at the end of every generation.
+
+Both implementations are measured the same way: the MyPathRanked objects
+allocated during a generation (by the operators or by deepcopy) are
+counted, and the objects still alive at the end of a generation that did
+not exist at its start are counted from gc.get_objects().
+
+Usage: python bench-generation.py [generations] [file ...]
+'''
+
+import copy
+import gc
+import sys
+import time
+
+from BitterRyter import CitiesLoader, DarwinForCities, MyPathRanked
+
+
+class DeepCopyDarwinForCities(DarwinForCities):
+    '''
+    DarwinForCities with the deep copies of the survivors done by the
+    former implementation
+    '''
+
+    def runAlgorithm(self):
+        best = DarwinForCities.runAlgorithm(self)
+        self.elit = copy.deepcopy(self.elit)
+        self.paths_list = copy.deepcopy(self.paths_list)
+        return best
+
+
+allocated_paths = [0]
+
+
+def countingNew(cls, *args, **kwargs):
+    '''
+    MyPathRanked.__new__ counting the allocated paths, deepcopy creates its
+    copies with __new__ too
+    '''
+    allocated_paths[0] += 1
+    return object.__new__(cls)
+
+
+def bench(solver_class, cities, generations):
+    '''
+    :return: seconds per generation, paths allocated per generation, new
+        objects still alive at the end of a generation
+    '''
+    d = solver_class(cities_list=cities, pop_number=50)
+    d.initialisation()
+    d.runAlgorithm()
+
+    gc.collect()
+    duration = 0.0
+    allocated_paths[0] = 0
+    new_objects = 0
+    for i in xrange(generations):
+        # the objects of the start are kept alive, their ids can't be reused
+        before = gc.get_objects()
+        known = set(id(o) for o in before)
+        start = time.time()
+        d.runAlgorithm()
+        duration += time.time() - start
+        gc.collect()
+        new_objects += sum(1 for o in gc.get_objects() if id(o) not in known)
+        before = known = None
+    return duration / generations, allocated_paths[0] / generations, new_objects / generations
+
+
+if __name__ == '__main__':
+    generations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    files = sys.argv[2:] or ['data/pb050.txt', 'data/pb100.txt', 'data/pb200.txt']
+
+    MyPathRanked.__new__ = staticmethod(countingNew)
+    print 'file;implementation;ms/generation;paths allocated/generation;new live objects/generation'
+    for filename in files:
+        cities = CitiesLoader.getCitiesFromFile(filename)
+        for name, solver_class in (('deepcopy', DeepCopyDarwinForCities), ('shared', DarwinForCities)):
+            duration, paths, objects = bench(solver_class, cities, generations)
+            print '%s;%s;%.2f;%d;%d' % (filename, name, duration * 1000, paths, objects)
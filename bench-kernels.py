@@ -0,0 +1,101 @@
+'''
+Microbenchmark and equivalence checks of the compiled kernels (see
+Kernels in BitterRyter) against the pure Python Genetic functions.
+
+For every instance the kernels must give the same results as Genetic:
+same length, same 2-opt path and moves, same mutated path for the same
+random numbers. Then both versions are timed. The script exits with
+status 1 if any check failed.
+
+Usage: python bench-kernels.py [repeat] [file ...]
+'''
+
+import sys
+import time
+from random import Random
+
+import BitterRyter
+from BitterRyter import CitiesLoader, Genetic, Kernels, SpatialGrid
+
+
+def timeit(func, repeat):
+    '''
+    :return: mean milliseconds of a call of func
+    '''
+    start = time.time()
+    for i in xrange(repeat):
+        func()
+    return (time.time() - start) * 1000.0 / repeat
+
+
+def check(kernels, cities, d, neighbours, rng):
+    '''
+    :return: list of the failed checks
+    '''
+    failed = []
+    l = len(cities)
+    for k in xrange(5):
+        path = Genetic.createPath(l, range(l), True, rng.random)
+        if abs(kernels.pathLength(path) - Genetic.pathLength(path, d)) > 1e-9 * l:
+            failed.append('pathLength')
+
+        rank = Genetic.pathLength(path, d)
+        path1, path2 = list(path), list(path)
+        result1 = Genetic.twoOpt(path1, rank, d, neighbours)
+        result2 = kernels.twoOpt(path2, rank, d, neighbours)
+        if path1 != path2 or result1[1] != result2[1] or abs(result1[0] - result2[0]) > 1e-9 * l:
+            failed.append('twoOpt')
+
+        randoms = kernels.np_rng.random_sample(2 * l)
+        values = iter(randoms)
+        expected = Genetic.mutation(path, 1.0, lambda: next(values))
+        if kernels.compiled['mutation'](Kernels.asArray(path), randoms).tolist() != expected:
+            failed.append('mutation')
+        mutated = kernels.mutation(path, rng.random())
+        if sorted(mutated) != range(l):
+            failed.append('mutation permutation')
+    return failed
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    files = sys.argv[2:] or ['data/pb100.txt', 'data/pb300.txt']
+
+    compiled = Kernels.load()
+    if compiled == None:
+        print 'numba is not installed: the solver uses the pure Python Genetic functions'
+        sys.exit()
+
+    rng = Random(1)
+    errors = []
+    print 'file;kernel;python ms;compiled ms;speedup;equivalent'
+    for filename in files:
+        cities = CitiesLoader.getCitiesFromFile(filename)
+        l = len(cities)
+        d = Genetic.createDistMatrix(cities)
+        grid = SpatialGrid([c[1] for c in cities], [c[2] for c in cities])
+        neighbours = grid.neighboursLists(10)
+        kernels = Kernels(compiled, d, neighbours, 1)
+        failed = check(kernels, cities, d, neighbours, rng)
+        errors.extend('%s: %s' % (filename, f) for f in sorted(set(failed)))
+
+        path = Genetic.createPath(l, range(l), True, rng.random)
+        rank = Genetic.pathLength(path, d)
+        arrayPath = BitterRyter.MyPathRanked(path, d).path
+        cases = (
+            ('pathLength', lambda: Genetic.pathLength(arrayPath, d), lambda: kernels.pathLength(arrayPath)),
+            ('twoOpt', lambda: Genetic.twoOpt(list(path), rank, d, neighbours),
+             lambda: kernels.twoOpt(list(path), rank, d, neighbours)),
+            ('mutation', lambda: Genetic.mutation(arrayPath, 0.5, rng.random),
+             lambda: kernels.mutation(arrayPath, 0.5)),
+        )
+        for name, python, native in cases:
+            native()
+            t1 = timeit(python, repeat)
+            t2 = timeit(native, repeat)
+            ok = not [f for f in failed if f.startswith(name)]
+            print '%s;%s;%.3f;%.3f;%.1f;%s' % (filename, name, t1, t2, t1 / t2, ok)
+
+    if errors:
+        sys.stderr.write('kernels not equivalent to Genetic:\n  %s\n' % '\n  '.join(errors))
+        sys.exit(1)
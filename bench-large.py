@@ -0,0 +1,56 @@
+'''
+Benchmark of the large instances mode of Darwin (distances computed from
+the coordinates, no dense matrix).
+
+Every size runs in its own process so the peak memory is its own. The
+cities are random like the ones of data/generate_cities.py.
+
+Usage: python bench-large.py [maxtime] [engine] [cities ...]
+'''
+
+import resource
+import subprocess
+import sys
+import time
+from random import Random
+
+from BitterRyter import ENGINES
+
+
+def randomCities(count, seed=1):
+    rng = Random(seed)
+    return [('v%d' % i, rng.randint(0, 500), rng.randint(0, 500)) for i in xrange(count)]
+
+
+def bench(count, maxtime, engine):
+    '''
+    Solve one random instance in this process
+    :return: setup seconds, peak memory MB, generations, first length, best length
+    '''
+    cities = randomCities(count)
+    stats = {}
+    start = time.time()
+    d = ENGINES[engine](cities_list=cities, max_time_s=maxtime, stats=stats,
+                        large_instance=True, start_time=start)
+    setup = time.time() - start
+    length, path = d.run()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return setup, peak, stats['generations'], stats['history'][0][1], length
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--one':
+        count, maxtime, engine = int(sys.argv[2]), float(sys.argv[3]), sys.argv[4]
+        setup, peak, generations, first, length = bench(count, maxtime, engine)
+        print '%d;%.1f;%.0f;%.0f;%d;%.2f;%.0f;%.0f' % (count, setup, peak, count * count * 8 / 2.0 ** 20,
+                                                      generations, generations / maxtime, first, length)
+        sys.exit()
+
+    maxtime = sys.argv[1] if len(sys.argv) > 1 else '60'
+    engine = sys.argv[2] if len(sys.argv) > 2 else 'python'
+    sizes = sys.argv[3:] or ['10000', '50000', '100000']
+
+    print 'cities;setup s;peak MB;dense matrix MB;generations;generations/s;first length;best length'
+    for count in sizes:
+        sys.stdout.flush()
+        subprocess.call([sys.executable, __file__, '--one', count, maxtime, engine])
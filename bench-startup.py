@@ -0,0 +1,47 @@
+'''
+Benchmark of the startup time of BitterRyter, measured in new processes.
+
+Compare a bare interpreter, the import of the module and a whole headless
+ga_solve call on small instances, and check that the headless path does not
+import pygame (nor numpy with the python engine).
+
+Usage: python bench-startup.py [runs] [file ...]
+'''
+
+import subprocess
+import sys
+import time
+
+IMPORT = 'import BitterRyter'
+SOLVE = ('import sys, BitterRyter\n'
+         'BitterRyter.ga_solve(%r, False, %r, %r)\n'
+         'sys.stderr.write(" ".join(m for m in ("pygame", "numpy") if m in sys.modules))\n')
+
+
+def bench(code, runs):
+    '''
+    :return: mean seconds of a new process running code, its stderr output
+    '''
+    output = ''
+    start = time.time()
+    for i in xrange(runs):
+        p = subprocess.Popen([sys.executable, '-c', code], stderr=subprocess.PIPE)
+        output = p.communicate()[1]
+        if p.returncode != 0:
+            raise RuntimeError(output)
+    return (time.time() - start) / runs, output
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    files = sys.argv[2:] or ['data/pb005.txt', 'data/pb010.txt']
+    maxtime = 0.1
+
+    print 'case;ms/process;imported modules'
+    for name, code in (('interpreter', 'pass'), ('import', IMPORT)):
+        duration, output = bench(code, runs)
+        print '%s;%.1f;' % (name, duration * 1000)
+    for filename in files:
+        for engine in ('python', 'numpy'):
+            duration, output = bench(SOLVE % (filename, maxtime, engine), runs)
+            print '%s@%ss %s;%.1f;%s' % (filename, maxtime, engine, duration * 1000, output)